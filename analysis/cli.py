@@ -8,6 +8,7 @@ from itertools import cycle
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 from .data_loader import load_sales_dataset
@@ -301,7 +302,9 @@ def _prompt_continue() -> bool:
 
 def _prompt_product_codes(df: pd.DataFrame) -> list[str]:
     available_series = df.get("cd_anuncio", pd.Series(dtype=str))
-    available = sorted({str(code).strip() for code in available_series.dropna() if str(code).strip()})
+    stripped = available_series.dropna().astype(str).str.strip()
+    available = np.sort(stripped[stripped != ""].unique()).tolist()
+    available_set = set(available)
     if available:
         preview = ", ".join(available[:10])
         suffix = "..." if len(available) > 10 else ""
@@ -318,7 +321,7 @@ def _prompt_product_codes(df: pd.DataFrame) -> list[str]:
             print("Informe ao menos um código de anúncio válido.")
             continue
         unique_codes = list(dict.fromkeys(parts))
-        missing = [code for code in unique_codes if code not in available]
+        missing = [code for code in unique_codes if code not in available_set]
         if missing and available:
             print(
                 "Aviso: alguns códigos não foram encontrados no filtro atual e serão considerados mesmo assim: "
@@ -4,6 +4,8 @@ from pathlib import Path
 from typing import Callable, Iterable, Optional, Sequence
 
 import hashlib
+import mmap
+import pickle
 import re
 
 import numpy as np
@@ -105,6 +107,8 @@ RETURN_NUMERIC_COLUMNS = [
 
 PERCENT_COLUMNS = ["perc_margem_bruta"]
 
+_NATSORT_RE = re.compile(r"(\d+)")
+
 
 ProgressCallback = Callable[[int, int], None]
 
@@ -126,11 +130,14 @@ class SalesDataLoader:
         self.cache_dir = Path(cache_dir) if cache_dir is not None else None
         self.enable_cache = enable_cache
         self.progress_callback = progress_callback
+        self._excel_mtime: float | None = None
 
     def load(self) -> pd.DataFrame:
         """Carrega vendas e devoluções, aplicando os tratamentos necessários."""
-        if not self.excel_path.exists():
-            raise FileNotFoundError(f"Arquivo não encontrado: {self.excel_path}")
+        try:
+            self._excel_mtime = self.excel_path.stat().st_mtime
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Arquivo não encontrado: {self.excel_path}") from None
 
         sales_sheets = self._resolve_sheet_names(self.sheet_name, required=True)
         return_sheets = self._resolve_sheet_names(self.return_prefix, required=False)
@@ -174,6 +181,8 @@ class SalesDataLoader:
         matches = [name for name in available if name.startswith(prefix)]
         if direct_match and direct_match not in matches:
             matches.insert(0, direct_match)
+        if len(matches) == 1:
+            return matches
         if matches:
             return sorted(matches, key=_natural_sort_key)
         if required:
@@ -188,12 +197,6 @@ class SalesDataLoader:
         signature.extend(f"{self.return_prefix}:{name}" for name in return_sheets)
         return signature or ["empty"]
 
-    def _normalize_columns(self, df: pd.DataFrame, column_map: dict[str, str]) -> pd.DataFrame:
-        rename_map = {original: column_map[original] for original in df.columns if original in column_map}
-        df = df.rename(columns=rename_map)
-        df.columns = [col.strip().lower() for col in df.columns]
-        return df
-
     def _read_group(
         self,
         sheet_names: Sequence[str],
@@ -205,16 +208,21 @@ class SalesDataLoader:
         if not sheet_names:
             return pd.DataFrame()
         frames: list[pd.DataFrame] = []
-        for name in sheet_names:
-            raw = pd.read_excel(
-                self.excel_path,
-                sheet_name=name,
-                engine="openpyxl",
-                dtype=dtype_map,
-            )
-            frames.append(self._normalize_columns(raw, column_map))
-            if on_sheet_read is not None:
-                on_sheet_read()
+        # as abas de um mesmo grupo compartilham o layout; o mapeamento é resolvido uma vez por cabeçalho
+        effective_map: dict[object, str] = {}
+        # o workbook é aberto uma única vez; reabrir por aba descompacta e indexa o arquivo a cada leitura
+        with pd.ExcelFile(self.excel_path, engine="openpyxl") as workbook:
+            for name in sheet_names:
+                header = workbook.parse(name, nrows=0).columns
+                keep = [column for column in header if column in column_map]
+                raw = workbook.parse(name, dtype=dtype_map, usecols=keep or None)
+                for original in raw.columns:
+                    if original not in effective_map:
+                        effective_map[original] = str(column_map.get(original, original)).strip().lower()
+                raw.columns = [effective_map[original] for original in raw.columns]
+                frames.append(raw)
+                if on_sheet_read is not None:
+                    on_sheet_read()
         return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
 
     def _notify_progress(self, processed: int, total: int) -> None:
@@ -229,12 +237,16 @@ class SalesDataLoader:
         if not self.enable_cache or self.cache_dir is None:
             return None
         cache_path = self._cache_path(signature)
-        if not cache_path.exists():
+        try:
+            cache_mtime = cache_path.stat().st_mtime
+        except OSError:
             return None
-        if cache_path.stat().st_mtime < self.excel_path.stat().st_mtime:
+        excel_mtime = self._excel_mtime if self._excel_mtime is not None else self.excel_path.stat().st_mtime
+        if cache_mtime < excel_mtime:
             return None
         try:
-            return pd.read_pickle(cache_path)
+            with open(cache_path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return pickle.loads(buffer)
         except Exception:
             return None
 
@@ -288,19 +300,22 @@ class SalesDataLoader:
 
     def _enrich(self, sales_df: pd.DataFrame, returns_df: pd.DataFrame) -> pd.DataFrame:
         if sales_df.empty:
-            result = sales_df.copy()
+            result = sales_df
             result.attrs["returns_data"] = pd.DataFrame()
             return result
 
-        df = sales_df.copy()
+        df = sales_df
 
         if "tp_registro" in df.columns:
-            df = df[df["tp_registro"].str.contains("venda", case=False, na=True)].copy()
+            df = df[_registro_mask(df["tp_registro"], "venda")].copy()
 
-        df["data"] = pd.to_datetime(df.get("data"), dayfirst=True, errors="coerce")
+        df["data"] = _parse_dates(df.get("data"))
         df["data"] = df["data"].dt.normalize()
-        df["ano_mes"] = df["data"].dt.strftime("%Y%m")
-        df["periodo"] = df["data"].dt.to_period("M")
+        periodo = df["data"].dt.to_period("M")
+        ano_mes = periodo.dt.year * 100 + periodo.dt.month
+        # texto YYYYMM no dtype de texto padrão, com NaN nas datas ausentes, como o strftime("%Y%m") fazia
+        df["ano_mes"] = ano_mes.astype(str).where(df["data"].notna(), np.nan)
+        df["periodo"] = periodo
 
         text_defaults = {
             "categoria": "Sem Categoria",
@@ -312,13 +327,21 @@ class SalesDataLoader:
             "tp_anuncio": "Nao informado",
             "nr_nota_fiscal": "",
         }
+        missing_text = {column: default for column, default in text_defaults.items() if column not in df.columns}
+        if missing_text:
+            df = df.assign(**missing_text)
+        # um único fillna em bloco e uma passada por coluna para converter, aparar e limpar "nan"
+        filled = df[list(text_defaults)].fillna(text_defaults)
+        cleaned: dict[str, list[str]] = {}
         for column, default in text_defaults.items():
-            if column not in df.columns:
-                df[column] = default
-            df[column] = df[column].fillna(default)
-            df[column] = df[column].astype(str).str.strip()
+            values = filled[column].to_numpy(dtype=object)
             if default == "":
-                df[column] = df[column].replace("nan", "")
+                cleaned[column] = [
+                    "" if (text := str(value).strip()) == "nan" else text for value in values
+                ]
+            else:
+                cleaned[column] = [str(value).strip() for value in values]
+        df = df.assign(**cleaned)
 
         if "cd_anuncio" not in df.columns:
             df["cd_anuncio"] = df.get("cd_produto", "")
@@ -329,11 +352,11 @@ class SalesDataLoader:
 
         returns_data = pd.DataFrame()
         if not returns_df.empty:
-            returns = returns_df.copy()
+            returns = returns_df
             if "tp_registro" in returns.columns:
-                returns = returns[returns["tp_registro"].str.contains("devol", case=False, na=True)].copy()
-            returns["data_venda"] = pd.to_datetime(returns.get("data_venda"), dayfirst=True, errors="coerce").dt.normalize()
-            returns["data_devolucao"] = pd.to_datetime(returns.get("data_devolucao"), dayfirst=True, errors="coerce").dt.normalize()
+                returns = returns[_registro_mask(returns["tp_registro"], "devol")].copy()
+            returns["data_venda"] = _parse_dates(returns.get("data_venda")).dt.normalize()
+            returns["data_devolucao"] = _parse_dates(returns.get("data_devolucao")).dt.normalize()
             returns["periodo_venda"] = returns["data_venda"].dt.to_period("M")
             returns["periodo_devolucao"] = returns["data_devolucao"].dt.to_period("M")
             returns["qtd_sku"] = returns.get("qtd_sku", 0).fillna(0.0)
@@ -343,13 +366,16 @@ class SalesDataLoader:
             returns["cd_anuncio"] = returns["cd_anuncio"].astype(str).str.strip()
             returns["ds_anuncio"] = returns["ds_anuncio"].astype(str).str.strip()
 
+            # chaves categóricas agrupam por códigos inteiros; sem ordenação pois o resultado vai direto ao merge
+            summary_keys = [returns[key].astype("category") for key in ("nr_nota_fiscal", "cd_produto")]
             summary = (
-                returns.groupby(["nr_nota_fiscal", "cd_produto"], as_index=False)
-                .agg(
-                    qtd_devolvido=("qtd_sku", "sum"),
-                    devolucao_receita_bruta=("devolucao_receita_bruta", "sum"),
-                )
+                returns.groupby(summary_keys, sort=False, observed=True)[["qtd_sku", "devolucao_receita_bruta"]]
+                .sum()
+                .reset_index()
+                .rename(columns={"qtd_sku": "qtd_devolvido"})
             )
+            for key in ("nr_nota_fiscal", "cd_produto"):
+                summary[key] = summary[key].astype(df[key].dtype)
             df = df.merge(summary, on=["nr_nota_fiscal", "cd_produto"], how="left")
 
             returns_data = returns[
@@ -370,7 +396,7 @@ class SalesDataLoader:
                     "qtd_sku",
                     "devolucao_receita_bruta",
                 ]
-            ].copy()
+            ].reset_index(drop=True)
         if "qtd_devolvido" not in df.columns:
             df["qtd_devolvido"] = 0.0
         df["qtd_devolvido"] = df["qtd_devolvido"].fillna(0.0)
@@ -405,6 +431,26 @@ def load_sales_dataset(path: Path | str, sheet_name: str = "VENDA", **kwargs) ->
     return loader.load()
 
 
-def _natural_sort_key(value: str) -> list[object]:
-    parts = re.split(r"(\d+)", value)
-    return [int(part) if part.isdigit() else part.lower() for part in parts]
+def _registro_mask(values: pd.Series, token: str) -> np.ndarray:
+    """Testa o tipo de registro nas poucas categorias distintas e expande o resultado pelos códigos."""
+    categorical = values.astype("category")
+    matches = categorical.cat.categories.str.contains(token, case=False, regex=False)
+    # código -1 (valor ausente) cai na última posição, mantendo as linhas sem tipo como no filtro original
+    lookup = np.append(np.asarray(matches, dtype=bool), True)
+    return lookup[categorical.cat.codes.to_numpy()]
+
+
+def _parse_dates(values: Optional[pd.Series]) -> Optional[pd.Series]:
+    """Converte datas priorizando o formato fixo DD/MM/AAAA e recorrendo ao dayfirst só nas sobras."""
+    if values is None or pd.api.types.is_datetime64_any_dtype(values):
+        return pd.to_datetime(values, errors="coerce")
+    parsed = pd.to_datetime(values, format="%d/%m/%Y", errors="coerce", cache=True)
+    pending = parsed.isna() & values.notna()
+    if pending.any():
+        parsed.loc[pending] = pd.to_datetime(values[pending], dayfirst=True, errors="coerce", cache=True)
+    return parsed
+
+
+def _natural_sort_key(value: str) -> tuple[object, ...]:
+    parts = _NATSORT_RE.split(value)
+    return tuple(int(part) if part.isdigit() else part.lower() for part in parts)
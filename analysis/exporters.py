@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 from datetime import datetime
 from pathlib import Path
 from typing import Dict
@@ -7,6 +8,8 @@ from typing import Dict
 import pandas as pd
 
 DEFAULT_OUTPUT_DIR = Path("output")
+# abas acima deste volume são gravadas linha a linha em constant_memory (sem estilo de tabela do Excel)
+CONSTANT_MEMORY_ROW_THRESHOLD = 100_000
 
 
 def export_to_excel(
@@ -26,16 +29,112 @@ def export_to_excel(
     file_path = output_path / f"{safe_base}_{timestamp}.xlsx"
 
     with pd.ExcelWriter(file_path, engine="xlsxwriter") as writer:
+        # os mesmos formatos de data que o to_excel aplicava (padrões do ExcelWriter)
+        date_formats = {
+            "date": writer.book.add_format({"num_format": writer.date_format}),
+            "datetime": writer.book.add_format({"num_format": writer.datetime_format}),
+        }
         for sheet_name, df in payload.items():
             sanitized_sheet = sheet_name[:31]
-            df.to_excel(writer, sheet_name=sanitized_sheet, index=False)
-            worksheet = writer.sheets[sanitized_sheet]
+            # a decisão é por aba: só as grandes abrem mão da tabela do Excel
+            if len(df.index) > CONSTANT_MEMORY_ROW_THRESHOLD:
+                worksheet = _add_constant_memory_worksheet(writer.book, sanitized_sheet)
+                _add_filter_layout(worksheet, df)
+                _write_rows(worksheet, df, date_formats)
+                continue
+            worksheet = writer.book.add_worksheet(sanitized_sheet)
+            _write_columns(worksheet, df, date_formats)
             table_name = _unique_table_name(sanitized_sheet, used_table_names)
             _add_table_layout(worksheet, df, table_name)
 
     return file_path
 
 
+def _add_constant_memory_worksheet(workbook, sheet_name: str):
+    """Cria uma única aba em constant_memory, mantendo as demais no modo normal (com tabelas)."""
+    # a opção pública do xlsxwriter vale para o arquivo todo e tiraria as tabelas das outras abas.
+    # Detalhe interno conferido no xlsxwriter 3.2.9: Workbook.constant_memory é copiado para a aba no
+    # add_worksheet; o valor anterior volta logo depois e, sem o atributo, a aba sai no modo normal
+    if not hasattr(workbook, "constant_memory"):
+        return workbook.add_worksheet(sheet_name)
+    previous = workbook.constant_memory
+    workbook.constant_memory = True
+    try:
+        return workbook.add_worksheet(sheet_name)
+    finally:
+        workbook.constant_memory = previous
+
+
+def _write_rows(worksheet, df: pd.DataFrame, date_formats: Dict[str, object]) -> None:
+    """Grava cabeçalho e linhas em ordem, requisito do modo constant_memory do xlsxwriter."""
+    worksheet.write_row(0, 0, [str(col) for col in df.columns])
+    # o método tipado (com o formato de data) é resolvido uma vez por coluna e aplicado célula a célula
+    writers = [_resolve_column_writer(worksheet, df[column], date_formats) for column in df.columns]
+    columns = [df[column].to_numpy(dtype=object) for column in df.columns]
+    missing = [_blank_mask(df[column]) for column in df.columns]
+    for row_idx in range(len(df.index)):
+        for col_idx, write_fn in enumerate(writers):
+            if not missing[col_idx][row_idx]:
+                write_fn(row_idx + 1, col_idx, columns[col_idx][row_idx])
+
+
+def _write_columns(worksheet, df: pd.DataFrame, date_formats: Dict[str, object]) -> None:
+    """Grava coluna a coluna escolhendo o método tipado do xlsxwriter uma única vez por coluna."""
+    worksheet.write_row(0, 0, [str(col) for col in df.columns])
+    for col_idx, column in enumerate(df.columns):
+        series = df[column]
+        write_fn = _resolve_column_writer(worksheet, series, date_formats)
+        missing = _blank_mask(series)
+        for row_idx, (value, is_missing) in enumerate(zip(series.to_numpy(dtype=object), missing), start=1):
+            if not is_missing:
+                write_fn(row_idx, col_idx, value)
+
+
+def _blank_mask(series: pd.Series):
+    # NaN/None e texto vazio ficam como célula em branco, como no to_excel
+    mask = series.isna().to_numpy()
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        mask = mask | (series.to_numpy(dtype=object) == "")
+    return mask
+
+
+def _resolve_column_writer(worksheet, series: pd.Series, date_formats: Dict[str, object]):
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == "string":
+        return worksheet.write_string
+    if inferred == "boolean":
+        return worksheet.write_boolean
+    if inferred == "integer":
+        return worksheet.write_number
+    if inferred in {"floating", "mixed-integer-float", "decimal"}:
+        return lambda row, col, value: _write_finite(worksheet, worksheet.write_number, row, col, value)
+    if inferred in {"datetime64", "datetime"}:
+        return lambda row, col, value: worksheet.write_datetime(row, col, value, date_formats["datetime"])
+    if inferred == "date":
+        return lambda row, col, value: worksheet.write_datetime(row, col, value, date_formats["date"])
+    return lambda row, col, value: _write_finite(worksheet, worksheet.write, row, col, value)
+
+
+def _write_finite(worksheet, write_fn, row: int, col: int, value) -> None:
+    # o xlsxwriter recusa inf (razões com denominador zero); o to_excel gravava o texto "inf"/"-inf"
+    if isinstance(value, float) and math.isinf(value):
+        worksheet.write_string(row, col, "inf" if value > 0 else "-inf")
+        return
+    write_fn(row, col, value)
+
+
+def _add_filter_layout(worksheet, df: pd.DataFrame) -> None:
+    rows = len(df.index)
+    cols = len(df.columns)
+    if rows == 0 or cols == 0:
+        return
+    # add_table não é suportado em constant_memory; mantém apenas autofiltro e larguras
+    worksheet.autofilter(0, 0, rows, cols - 1)
+    # o formato de data já vai em cada célula; aqui só a largura, como no layout de tabela
+    for col_idx in range(cols):
+        worksheet.set_column(col_idx, col_idx, 15)
+
+
 def _add_table_layout(worksheet, df: pd.DataFrame, table_name: str) -> None:
     rows = len(df.index)
     cols = len(df.columns)
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 from typing import Iterable
 
+import numpy as np
 import pandas as pd
 
+_PERCENT_TEXT_TABLE = str.maketrans({"%": None, ".": None, ",": "."})
+
 
 def format_percentage_columns(df: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
     """Retorna uma cópia do DataFrame com colunas percentuais normalizadas como float."""
@@ -13,15 +16,10 @@ def format_percentage_columns(df: pd.DataFrame, columns: Iterable[str]) -> pd.Da
             continue
         series = formatted[column]
         if pd.api.types.is_numeric_dtype(series):
-            formatted[column] = pd.to_numeric(series, errors="coerce").fillna(0).astype(float)
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
         else:
-            normalized = (
-                series.astype(str)
-                .str.replace("%", "", regex=False)
-                .str.replace(".", "", regex=False)
-                .str.replace(",", ".", regex=False)
-            )
-            numeric = pd.to_numeric(normalized, errors="coerce").fillna(0) / 100
-            formatted[column] = numeric.astype(float)
-        formatted[column] = formatted[column].round(6)
+            # remove "%" e separador de milhar e troca a vírgula decimal numa única passada
+            normalized = series.astype(str).str.translate(_PERCENT_TEXT_TABLE)
+            values = pd.to_numeric(normalized, errors="coerce").to_numpy(dtype="float64") / 100
+        formatted[column] = np.round(np.where(np.isnan(values), 0.0, values), 6)
     return formatted
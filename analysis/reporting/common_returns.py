@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from typing import Dict, Iterable, Optional, Sequence, Set
 
 import numpy as np
@@ -12,6 +13,24 @@ _DEFAULT_UNITS_CANDIDATES: Sequence[str] = (
     "quantidade",
     "unid",
 )
+_NULL_CODE_TOKENS = ("", "nan", "none", "null")
+_ZERO_FRACTION_PATTERN = re.compile(r"^([^.]*)\.0*$")
+# dtype padrão de texto da versão instalada (str no pandas 3, object no 2), o mesmo que o astype(str) produz
+_TEXT_DTYPE = pd.Series([""]).dtype
+# colunas da base de vendas lidas pelos relatórios de baixo custo e de potencial
+SALES_REPORT_COLUMNS = (
+    "categoria",
+    "cd_anuncio",
+    "ds_anuncio",
+    "cd_produto",
+    "periodo",
+    "data",
+    "nr_nota_fiscal",
+    "qtd_sku",
+    "rbld",
+    "custo_produto",
+    "perc_margem_bruta",
+)
 
 
 def normalize_product_codes(series: object, index: Optional[pd.Index] = None) -> pd.Series:
@@ -23,29 +42,25 @@ def normalize_product_codes(series: object, index: Optional[pd.Index] = None) ->
     else:
         base_series = pd.Series(series, index=index)
 
-    def _normalize(value: object) -> str:
-        if pd.isna(value):
-            return ""
-        if isinstance(value, (np.integer, int)):
-            return str(int(value))
-        if isinstance(value, (np.floating, float)):
-            if not np.isfinite(value):
-                return ""
-            if float(value).is_integer():
-                return str(int(value))
-            value = f"{value:f}"
-        text = str(value).strip()
-        lowered = text.lower()
-        if lowered in {"", "nan", "none", "null"}:
-            return ""
-        if "." in text:
-            integer, fractional = text.split(".", 1)
-            if fractional.strip("0") == "":
-                return integer
-        return text
-
-    normalized = base_series.apply(_normalize).astype(str)
-    return normalized
+    if pd.api.types.is_integer_dtype(base_series):
+        return base_series.astype(str).where(base_series.notna(), "").astype(str)
+
+    if pd.api.types.is_float_dtype(base_series):
+        values = base_series.to_numpy(dtype="float64", na_value=np.nan)
+        finite = np.isfinite(values)
+        integral = finite & (np.mod(values, 1, where=finite, out=np.ones_like(values)) == 0)
+        normalized = np.full(len(values), "", dtype=object)
+        normalized[integral] = values[integral].astype("int64").astype(str)
+        fractional = finite & ~integral
+        normalized[fractional] = [f"{value:f}" for value in values[fractional]]
+        # mesmo dtype de texto dos caminhos inteiro e textual, para isin/merge não dependerem de como o Excel tipou a coluna
+        return pd.Series(normalized, index=base_series.index).astype(str)
+
+    text = base_series.astype(str).str.strip()
+    missing = base_series.isna().to_numpy() | text.str.lower().isin(_NULL_CODE_TOKENS).to_numpy()
+    # "123.000" -> "123": ponto seguido apenas de zeros é resíduo de leitura numérica
+    text = text.str.replace(_ZERO_FRACTION_PATTERN, r"\1", regex=True)
+    return text.where(~missing, "").astype(str)
 
 
 def detect_units_column(df: pd.DataFrame, candidates: Optional[Iterable[str]] = None) -> str:
@@ -57,6 +72,53 @@ def detect_units_column(df: pd.DataFrame, candidates: Optional[Iterable[str]] =
     return "qtd_sku"
 
 
+def filter_by_category(
+    df: pd.DataFrame,
+    category: Optional[str],
+    columns: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """Recorta a base de vendas na categoria pedida (ou inteira, sem categoria), opcionalmente só com ``columns``.
+
+    Não há cópia defensiva: sem categoria nem projeção a própria base é devolvida, então quem
+    deriva colunas a partir do recorte deve usar ``assign`` em vez de atribuir no lugar.
+    """
+    selected = None if columns is None else [column for column in columns if column in df.columns]
+    if not category:
+        filtered = df if selected is None else df[selected]
+    else:
+        mask = _category_mask(df["categoria"], category)
+        filtered = df.loc[mask] if selected is None else df.loc[mask, selected]
+    if filtered is not df:
+        filtered.attrs = dict(df.attrs)
+    return filtered
+
+
+def _category_mask(categories: pd.Series, category: str) -> np.ndarray:
+    if isinstance(categories.dtype, pd.CategoricalDtype):
+        # coluna já categórica: a comparação é feita sobre os códigos inteiros, sem tocar no texto
+        position = categories.cat.categories.get_indexer([category])[0]
+        if position < 0:
+            return np.zeros(len(categories), dtype=bool)
+        return categories.cat.codes.to_numpy() == position
+    # texto não é convertido aqui: o astype("category") por chamada faz um hash por linha e custa
+    # mais que o próprio ==, então só bases que já chegam categóricas usam o caminho por códigos
+    return (categories == category).to_numpy()
+
+
+def safe_div(numerator: object, denominator: object) -> np.ndarray:
+    # divide só onde o denominador é positivo; o resto fica 0 sem gerar inf/NaN intermediários
+    num = np.asarray(numerator, dtype="float64")
+    den = np.asarray(denominator, dtype="float64")
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def invoice_codes(invoices: pd.Series) -> np.ndarray:
+    # notas viram códigos numéricos para o nunique não re-hashear texto; NaN segue fora da contagem
+    codes = pd.factorize(invoices, sort=False)[0].astype("float64")
+    codes[codes < 0] = np.nan
+    return codes
+
+
 def ensure_period_series(
     df: pd.DataFrame,
     period_column: str,
@@ -79,6 +141,22 @@ def ensure_period_series(
     return pd.Series(pd.PeriodIndex([pd.NaT] * len(df), freq="M"), index=df.index)
 
 
+def format_period_labels(series: pd.Series) -> pd.Series:
+    """Converte uma Series Period[M] em texto YYYY-MM formatando apenas os períodos distintos."""
+    codes, uniques = pd.factorize(series, sort=False)
+    # o código -1 (NaT) aponta para o NaN extra no fim: período ausente segue ausente. O astype(str)
+    # não serve aqui porque muda conforme a versão ("NaT" no pandas 2, NaN no pandas 3)
+    labels = np.append(uniques.astype(str).to_numpy(dtype=object), np.nan)
+    return pd.Series(labels[codes], index=series.index, dtype=_TEXT_DTYPE)
+
+
+def collect_period_labels(labels: pd.Series) -> Set[str]:
+    """Conjunto dos rótulos de período presentes, sem ausentes, vazios ou "NaT"."""
+    # só os distintos voltam ao Python; ausentes saem antes do teste de texto
+    uniques = pd.unique(labels.dropna().to_numpy()).tolist()
+    return {p for p in uniques if isinstance(p, str) and p and p.lower() != "nat"}
+
+
 def build_period_product_totals(
     df: pd.DataFrame,
     *,
@@ -104,33 +182,42 @@ def build_period_product_totals(
             columns.extend(dest for dest, _ in extra_aggs.values())
         return pd.DataFrame(columns=columns)
 
-    working = df.copy()
-
-    period_series = ensure_period_series(working, period_column, date_column)
-    working["periodo"] = period_series.astype(str)
-
+    # monta um frame enxuto só com as colunas usadas no agrupamento, sem copiar a base inteira
+    period_series = format_period_labels(ensure_period_series(df, period_column, date_column))
+    detected_units = units_column or detect_units_column(df)
+    needed = [
+        column
+        for column in dict.fromkeys([product_column, detected_units, *(extra_aggs or {})])
+        if column in df.columns
+    ]
+    scoped = df[needed]
     if allowed_periods:
         allowed_str = {str(p) for p in allowed_periods if p and str(p).lower() != "nat"}
-        working = working[working["periodo"].isin(allowed_str)].copy()
-        if working.empty:
+        period_mask = period_series.isin(allowed_str)
+        if not period_mask.any():
             columns = ["periodo", product_column, unit_result_name]
             if include_order_count:
                 columns.append(order_result_name)
             if extra_aggs:
                 columns.extend(dest for dest, _ in extra_aggs.values())
             return pd.DataFrame(columns=columns)
+        period_series = period_series[period_mask]
+        scoped = df.loc[period_mask, needed]
 
-    if product_column in working.columns:
-        working[product_column] = normalize_product_codes(working[product_column])
+    working = pd.DataFrame({"periodo": period_series}, index=scoped.index)
+    if product_column in scoped.columns:
+        working[product_column] = normalize_product_codes(scoped[product_column])
     else:
         working[product_column] = normalize_product_codes("", index=working.index)
 
-    detected_units = units_column or detect_units_column(working)
-    if detected_units not in working.columns:
-        working[detected_units] = 0.0
-
-    working["__units__"] = pd.to_numeric(working.get(detected_units, 0), errors="coerce").fillna(0.0)
+    if detected_units in scoped.columns:
+        working["__units__"] = pd.to_numeric(scoped[detected_units], errors="coerce").fillna(0.0)
+    else:
+        working["__units__"] = 0.0
     working["__rows__"] = 1
+    if extra_aggs:
+        for extra_source in extra_aggs:
+            working[extra_source] = scoped[extra_source]
 
     aggregations: Dict[str, tuple[str, str]] = {
         unit_result_name: ("__units__", "sum"),
@@ -142,10 +229,15 @@ def build_period_product_totals(
         for source, (dest, func) in extra_aggs.items():
             aggregations[dest] = (source, func)
 
+    # chaves categóricas agrupam por códigos inteiros; o resultado volta a texto para os merges seguintes
+    working["periodo"] = working["periodo"].astype("category")
+    working[product_column] = working[product_column].astype("category")
     grouped = (
-        working.groupby(["periodo", product_column], as_index=False)
+        working.groupby(["periodo", product_column], as_index=False, observed=True, sort=False)
         .agg(**{dest: (source, func) for dest, (source, func) in aggregations.items()})
     )
+    grouped["periodo"] = grouped["periodo"].astype(str)
+    grouped[product_column] = grouped[product_column].astype(str)
 
     grouped[unit_result_name] = grouped[unit_result_name].fillna(0.0)
     if include_order_count:
@@ -8,9 +8,14 @@ import pandas as pd
 from ..formatting import format_percentage_columns
 from . import returns as returns_report
 from .common_returns import (
+    SALES_REPORT_COLUMNS,
     build_period_product_totals,
+    collect_period_labels,
     ensure_period_series,
+    filter_by_category,
+    format_period_labels,
     normalize_product_codes,
+    safe_div,
 )
 
 COST_PERCENTILE = 0.25
@@ -27,51 +32,30 @@ def build_low_cost_reputation_analysis(
     historical_prices: Optional[Dict[str, float]] = None,
 ) -> Dict[str, pd.DataFrame]:
     """Sugere itens baratos, com boa saída e baixa devolução para fortalecer reputação."""
-    data = _filter_by_category(df, category)
-    data["cd_produto"] = normalize_product_codes(data.get("cd_produto", ""))
+    # projeta só as colunas usadas antes de filtrar, para não carregar a base inteira adiante
+    data = filter_by_category(df, category, SALES_REPORT_COLUMNS)
     period_series = ensure_period_series(data, "periodo", "data")
-    data["periodo"] = period_series.astype(str)
-    allowed_periods: Set[str] = {
-        p for p in data["periodo"].dropna().astype(str) if p and p.lower() != "nat"
-    }
+    data = data.assign(
+        cd_produto=normalize_product_codes(data.get("cd_produto", "")),
+        periodo=format_period_labels(period_series),
+    )
+    allowed_periods = collect_period_labels(data["periodo"])
     receita_total = pd.to_numeric(data.get("rbld", 0), errors="coerce")
     quantidade = pd.to_numeric(data.get("qtd_sku", 0), errors="coerce")
     preco_rbld_unitario = np.where(quantidade > 0, receita_total / quantidade, np.nan)
     preco_rbld_unitario = np.where(np.isfinite(preco_rbld_unitario), preco_rbld_unitario, np.nan)
-    data_pricing = data.assign(_preco_rbld=preco_rbld_unitario)
-    data_pricing.attrs = dict(data.attrs)
-    returns_totals = _compute_returns_totals(data_pricing, category, allowed_periods)
+    # o preço unitário só alimenta o mínimo do intervalo: fica como Series avulsa, fora da base
+    preco_rbld = pd.Series(preco_rbld_unitario, index=data.index)
+    returns_totals = _compute_returns_totals(data, category, allowed_periods)
     categoria_default = category if category is not None else ""
 
-    interval_prices = (
-        data_pricing.groupby("cd_anuncio")["_preco_rbld"].min()
-        .replace([np.inf, -np.inf], np.nan)
-    )
-
-    aggregated = (
-        data_pricing.groupby(["cd_anuncio", "ds_anuncio"], as_index=False)
-        .agg(
-            itens_vendidos_total=("qtd_sku", "sum"),
-            pedidos_total=("nr_nota_fiscal", "nunique"),
-            receita_total=("rbld", "sum"),
-            custo_medio_unitario=("custo_produto", "mean"),
-            custo_produto=("custo_produto", "sum"),
-            itens_devolvidos_total=("qtd_devolvido", "sum"),
-            receita_itens_devolvidos_total=("devolucao_receita_bruta", "sum"),
-            margem_media=("perc_margem_bruta", "mean"),
-            categoria=("categoria", "first"),
-            cd_produto=("cd_produto", "first"),
-        )
-    )
+    # cd_anuncio é codificado uma única vez e reaproveitado no agrupamento e no preço mínimo
+    listing = data["cd_anuncio"].astype("category")
+    aggregated = _aggregate_by_listing(data, listing)
 
     if aggregated.empty:
         return {"produtos_indicados": aggregated}
 
-    aggregated.drop(
-        columns=["itens_devolvidos_total", "receita_itens_devolvidos_total"],
-        inplace=True,
-        errors="ignore",
-    )
     aggregated = aggregated.merge(returns_totals, on="cd_produto", how="left")
     aggregated.rename(
         columns={
@@ -79,21 +63,20 @@ def build_low_cost_reputation_analysis(
         },
         inplace=True,
     )
-    aggregated["itens_devolvidos_total"] = aggregated.get("itens_devolvidos_total", 0.0).fillna(0.0)
-    aggregated["receita_devolucao_total"] = aggregated.get("receita_devolucao_total", 0.0).fillna(0.0)
-    aggregated["pedidos_devolvidos_total"] = aggregated.get("pedidos_devolvidos_total", 0).fillna(0).astype(int)
-    aggregated["categoria"] = aggregated.get("categoria", categoria_default).fillna(categoria_default)
+    # o merge com returns_totals sempre traz as colunas de devolução; um único fillna cobre todas
+    aggregated = aggregated.fillna(
+        {
+            "itens_devolvidos_total": 0.0,
+            "receita_devolucao_total": 0.0,
+            "pedidos_devolvidos_total": 0,
+            "categoria": categoria_default,
+        }
+    ).astype({"pedidos_devolvidos_total": int})
 
-    aggregated["taxa_devolucao"] = np.where(
-        aggregated["itens_vendidos_total"] > 0,
-        aggregated["itens_devolvidos_total"] / aggregated["itens_vendidos_total"],
-        0,
-    )
-    aggregated["ticket_medio_estimado"] = np.where(
-        aggregated["pedidos_total"] > 0,
-        aggregated["receita_total"] / aggregated["pedidos_total"],
-        0,
+    aggregated["taxa_devolucao"] = safe_div(
+        aggregated["itens_devolvidos_total"], aggregated["itens_vendidos_total"]
     )
+    aggregated["ticket_medio_estimado"] = safe_div(aggregated["receita_total"], aggregated["pedidos_total"])
 
     custo_threshold = aggregated["custo_medio_unitario"].quantile(cost_percentile)
 
@@ -101,38 +84,41 @@ def build_low_cost_reputation_analysis(
         (aggregated["custo_medio_unitario"] <= custo_threshold)
         & (aggregated["itens_vendidos_total"] >= min_quantity)
         & (aggregated["taxa_devolucao"] <= max_return_rate)
-    ].copy()
-
-    selecionados.sort_values(
-        ["custo_medio_unitario", "itens_vendidos_total"],
-        ascending=[True, False],
-        inplace=True,
-    )
+    ]
 
-    selecionados["potencial_reputacao_score"] = (
-        (1 - selecionados["taxa_devolucao"]) * selecionados["itens_vendidos_total"]
-    ) / np.where(
-        selecionados["custo_medio_unitario"] > 0,
-        selecionados["custo_medio_unitario"],
-        1,
-    )
-    selecionados.sort_values(
-        "potencial_reputacao_score",
-        ascending=False,
-        inplace=True,
-    )
+    custo_medio = selecionados["custo_medio_unitario"].to_numpy(dtype="float64")
+    score = (
+        (1 - selecionados["taxa_devolucao"].to_numpy(dtype="float64"))
+        * selecionados["itens_vendidos_total"].to_numpy(dtype="float64")
+    ) / np.where(custo_medio > 0, custo_medio, 1.0)
+    # score decrescente; no empate, custo médio crescente e, por fim, cd_anuncio para a ordem ser determinística
+    anuncio = pd.factorize(selecionados["cd_anuncio"], sort=True)[0]
+    order = np.lexsort((anuncio, custo_medio, -score))
+    selecionados = selecionados.iloc[order].copy()
+    selecionados["potencial_reputacao_score"] = score[order]
     if "categoria" not in selecionados.columns:
         selecionados["categoria"] = categoria_default
 
-    selecionados["preco_min_unitario_intervalo"] = pd.to_numeric(
-        selecionados["cd_anuncio"].map(interval_prices), errors="coerce"
-    ).round(2)
-    if historical_prices:
-        selecionados["preco_min_unitario_historico_total"] = pd.to_numeric(
-            selecionados["cd_anuncio"].map(historical_prices), errors="coerce"
-        ).round(2)
-    else:
-        selecionados["preco_min_unitario_historico_total"] = np.nan
+    # o menor preço do intervalo só é necessário para os anúncios que passaram nos filtros
+    selected_listings = listing.isin(selecionados["cd_anuncio"].unique())
+    interval_prices = (
+        preco_rbld[selected_listings]
+        .groupby(listing[selected_listings], sort=False, observed=True)
+        .min()
+        .dropna()
+    )
+    interval_prices.index = interval_prices.index.astype(data["cd_anuncio"].dtype)
+    # reindex faz a busca por anúncio numa única junção de índice, sem percorrer um dict por linha
+    listing_codes = selecionados["cd_anuncio"].to_numpy()
+    prices = np.full((len(listing_codes), 2), np.nan)
+    prices[:, 0] = interval_prices.reindex(listing_codes).to_numpy(dtype="float64", na_value=np.nan)
+    if historical_prices is not None and len(historical_prices) > 0:
+        historical_series = pd.to_numeric(pd.Series(historical_prices), errors="coerce")
+        prices[:, 1] = historical_series.reindex(listing_codes).to_numpy(dtype="float64", na_value=np.nan)
+    # as duas colunas de preço são arredondadas numa única passada
+    np.round(prices, 2, out=prices)
+    selecionados["preco_min_unitario_intervalo"] = prices[:, 0]
+    selecionados["preco_min_unitario_historico_total"] = prices[:, 1]
 
     selecionados_fmt = format_percentage_columns(
         selecionados,
@@ -167,13 +153,38 @@ def build_low_cost_reputation_analysis(
     return {"produtos_indicados": selecionados_fmt}
 
 
-def _filter_by_category(df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
-    if not category:
-        filtered = df.copy()
-    else:
-        filtered = df[df["categoria"] == category].copy()
-    filtered.attrs = dict(df.attrs)
-    return filtered
+def _aggregate_by_listing(data: pd.DataFrame, listing: pd.Series) -> pd.DataFrame:
+    """Agrega por anúncio usando somas e contagens; médias saem de soma/contagem e pedidos de notas distintas."""
+    keys = ["cd_anuncio", "ds_anuncio"]
+    key_dtypes = {key: data[key].dtype for key in keys}
+    # chaves categóricas agrupam por códigos inteiros; o resultado volta ao tipo original no fim
+    data = data.assign(cd_anuncio=listing, ds_anuncio=data["ds_anuncio"].astype("category"))
+    grouped = data.groupby(keys, sort=False, observed=True)
+    sums = grouped[["qtd_sku", "rbld", "custo_produto", "perc_margem_bruta"]].sum()
+    counts = grouped[["custo_produto", "perc_margem_bruta"]].count()
+    firsts = grouped[["categoria", "cd_produto"]].first()
+    # notas distintas por anúncio: pares (grupo, nota) empacotados em int64, ordenados e deduplicados
+    group_codes = grouped.ngroup().to_numpy()
+    invoice_codes, _ = pd.factorize(data["nr_nota_fiscal"], sort=False)
+    valid = (group_codes >= 0) & (invoice_codes >= 0)
+    pairs = np.unique((group_codes[valid].astype(np.int64) << 32) | invoice_codes[valid].astype(np.int64))
+    pedidos = np.bincount(pairs >> 32, minlength=len(sums))
+
+    aggregated = pd.DataFrame(
+        {
+            "itens_vendidos_total": sums["qtd_sku"],
+            "pedidos_total": pedidos,
+            "receita_total": sums["rbld"],
+            "custo_medio_unitario": sums["custo_produto"] / counts["custo_produto"],
+            "custo_produto": sums["custo_produto"],
+            "margem_media": sums["perc_margem_bruta"] / counts["perc_margem_bruta"],
+            "categoria": firsts["categoria"],
+            "cd_produto": firsts["cd_produto"],
+        },
+        index=sums.index,
+    )
+    aggregated = aggregated.reset_index()
+    return aggregated.astype(key_dtypes)
 
 
 def _compute_returns_totals(
@@ -181,10 +192,8 @@ def _compute_returns_totals(
     category: Optional[str],
     allowed_periods: Set[str],
 ) -> pd.DataFrame:
-    returns_raw = data.attrs.get("returns_data", pd.DataFrame())
-    returns_filtered = returns_report._filter_returns_dataset(returns_raw, category)
-    prepared = returns_report._prepare_returns_dataset(returns_filtered)
-    if prepared is None or prepared.empty:
+    prepared = returns_report._get_prepared_returns(data.attrs.get("returns_data"))
+    if prepared.empty:
         return pd.DataFrame(
             columns=[
                 "cd_produto",
@@ -194,54 +203,43 @@ def _compute_returns_totals(
             ]
         )
 
-    prepared = prepared.copy()
-    prepared["cd_produto"] = normalize_product_codes(prepared.get("cd_produto", ""), index=prepared.index)
+    # a base preparada é compartilhada entre relatórios: aqui ela só recebe filtros por máscara
+    mask = np.ones(len(prepared), dtype=bool)
+    if category:
+        mask &= (prepared["categoria"] == category).to_numpy()
 
-    product_scope = set(data["cd_produto"].dropna().astype(str))
-    if product_scope:
-        prepared = prepared[prepared["cd_produto"].isin(product_scope)].copy()
-        if prepared.empty:
-            return pd.DataFrame(
-                columns=[
-                    "cd_produto",
-                    "itens_devolvidos_total",
-                    "pedidos_devolvidos_total",
-                    "receita_devolucao_total",
-                ]
-            )
+    # cd_produto já vem normalizado como texto: unique evita montar um set Python com cada linha
+    product_scope = data["cd_produto"].unique()
+    if len(product_scope) > 0:
+        mask &= prepared["cd_produto"].isin(product_scope).to_numpy()
 
-    data_dates = pd.to_datetime(data.get("data"), dayfirst=True, errors="coerce").dt.normalize()
+    data_dates = data.get("data")
+    # o loader já entrega datetime64; só reinterpreta texto quando a base vier de outra origem
+    if not pd.api.types.is_datetime64_any_dtype(data_dates):
+        data_dates = pd.to_datetime(data_dates, dayfirst=True, errors="coerce")
     min_date = data_dates.min() if not data_dates.empty else None
     max_date = data_dates.max() if not data_dates.empty else None
-
-    prepared["data"] = pd.to_datetime(prepared.get("data_venda"), errors="coerce").dt.normalize()
+    # normalizar os extremos equivale a normalizar a coluna inteira
+    if min_date is not None and pd.notna(min_date):
+        min_date = min_date.normalize()
+    if max_date is not None and pd.notna(max_date):
+        max_date = max_date.normalize()
     if min_date is not None and max_date is not None:
-        prepared = prepared[
-            (prepared["data"] >= min_date)
-            & (prepared["data"] <= max_date)
-        ].copy()
-        if prepared.empty:
-            return pd.DataFrame(
-                columns=[
-                    "cd_produto",
-                    "itens_devolvidos_total",
-                    "pedidos_devolvidos_total",
-                    "receita_devolucao_total",
-                ]
-            )
+        mask &= ((prepared["data"] >= min_date) & (prepared["data"] <= max_date)).to_numpy()
 
-    prepared["periodo"] = ensure_period_series(prepared, "periodo_venda", "data_venda").astype(str)
     if allowed_periods:
-        prepared = prepared[prepared["periodo"].isin(allowed_periods)].copy()
-        if prepared.empty:
-            return pd.DataFrame(
-                columns=[
-                    "cd_produto",
-                    "itens_devolvidos_total",
-                    "pedidos_devolvidos_total",
-                    "receita_devolucao_total",
-                ]
-            )
+        mask &= prepared["periodo"].isin(allowed_periods).to_numpy()
+
+    prepared = prepared[mask]
+    if prepared.empty:
+        return pd.DataFrame(
+            columns=[
+                "cd_produto",
+                "itens_devolvidos_total",
+                "pedidos_devolvidos_total",
+                "receita_devolucao_total",
+            ]
+        )
 
     totals = build_period_product_totals(
         prepared,
@@ -276,7 +274,10 @@ def _compute_returns_totals(
             receita_devolucao_total=("receita_itens_devolvidos_total", "sum"),
         )
     )
-    aggregated["pedidos_devolvidos_total"] = aggregated["pedidos_devolvidos_total"].fillna(0).astype(int)
-    aggregated["itens_devolvidos_total"] = aggregated["itens_devolvidos_total"].fillna(0.0)
-    aggregated["receita_devolucao_total"] = aggregated["receita_devolucao_total"].fillna(0.0)
-    return aggregated
+    return aggregated.fillna(
+        {
+            "itens_devolvidos_total": 0.0,
+            "pedidos_devolvidos_total": 0,
+            "receita_devolucao_total": 0.0,
+        }
+    ).astype({"pedidos_devolvidos_total": int})
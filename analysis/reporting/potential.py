@@ -8,9 +8,15 @@ import pandas as pd
 from ..formatting import format_percentage_columns
 from . import returns as returns_report
 from .common_returns import (
+    SALES_REPORT_COLUMNS,
     build_period_product_totals,
+    collect_period_labels,
     ensure_period_series,
+    filter_by_category,
+    format_period_labels,
+    invoice_codes,
     normalize_product_codes,
+    safe_div,
 )
 
 RECENT_WINDOW = 3
@@ -51,62 +57,93 @@ def build_potential_sku_analysis(
 
     Como o produto tinha desempenho constante por quase dois anos e despencou nos meses recentes, ele entra como candidato: o histórico mostra potencial, a janela recente sinaliza queda e, se a taxa de devolução/margem estiver aceitável, o relatório classifica esse SKU como “em potencial".
     """
-    data = _filter_by_category(df, category)
+    # projeta só as colunas usadas antes de filtrar, para não carregar a base inteira adiante
+    data = filter_by_category(df, category, SALES_REPORT_COLUMNS)
 
     if "cd_produto" in data.columns:
-        data["cd_produto"] = normalize_product_codes(data["cd_produto"])
+        product_codes = normalize_product_codes(data["cd_produto"])
     else:
-        data["cd_produto"] = normalize_product_codes("", index=data.index)
+        product_codes = normalize_product_codes("", index=data.index)
 
     period_series = ensure_period_series(data, "periodo", "data")
-    data["periodo"] = period_series.astype(str)
-    allowed_periods: Set[str] = {
-        str(p) for p in period_series.dropna().tolist() if str(p) and str(p).lower() != "nat"
-    }
+    data = data.assign(cd_produto=product_codes, periodo=format_period_labels(period_series))
+    allowed_periods = collect_period_labels(data["periodo"])
 
     receita_total = pd.to_numeric(data.get("rbld", 0), errors="coerce")
     quantidade = pd.to_numeric(data.get("qtd_sku", 0), errors="coerce")
     preco_rbld_unitario = np.where(quantidade > 0, receita_total / quantidade, np.nan)
     preco_rbld_unitario = np.where(np.isfinite(preco_rbld_unitario), preco_rbld_unitario, np.nan)
-    data_pricing = data.assign(_preco_rbld=preco_rbld_unitario)
-    data_pricing.attrs = dict(data.attrs)
-
-    produto_map = pd.Series(dtype="object")
-    if "cd_anuncio" in data_pricing.columns:
-        produto_map = (
-            data_pricing.loc[data_pricing["cd_anuncio"].notna(), ["cd_anuncio", "cd_produto"]]
-            .drop_duplicates(subset=["cd_anuncio"])
-            .set_index("cd_anuncio")["cd_produto"]
-        )
+    preco_rbld = pd.Series(preco_rbld_unitario, index=data.index)
 
-    categoria_map = None
+    # produto, categoria e preço mínimo por anúncio saem de um único groupby
+    listing_aggs = {
+        "cd_produto": ("cd_produto", "first"),
+        "preco_min": ("_preco_rbld", "min"),
+    }
+    if "categoria" in data.columns:
+        listing_aggs["categoria"] = ("categoria", "first")
+    listing_info = data.assign(_preco_rbld=preco_rbld).groupby("cd_anuncio", sort=False).agg(**listing_aggs)
     categoria_default = category if category is not None else ""
-    if "categoria" in data_pricing.columns:
-        categoria_map = (
-            data_pricing.loc[data_pricing["cd_anuncio"].notna(), ["cd_anuncio", "categoria"]]
-            .drop_duplicates(subset=["cd_anuncio"])
-            .set_index("cd_anuncio")["categoria"]
-        )
+    # tabela única por anúncio (produto, categoria, preços): cada frame de saída faz um só reindex nela
+    # preco_rbld já tem inf trocado por NaN, então o mínimo dispensa o replace
+    listing_lookup = listing_info.rename(columns={"preco_min": "preco_min_intervalo"})
+    if "categoria" not in listing_lookup.columns:
+        listing_lookup["categoria"] = categoria_default
+    if historical_prices:
+        historical_series = pd.to_numeric(pd.Series(historical_prices), errors="coerce")
+        listing_lookup["preco_min_historico_total"] = historical_series.reindex(listing_lookup.index)
+    else:
+        listing_lookup["preco_min_historico_total"] = np.nan
+    listing_lookup = listing_lookup.fillna({"cd_produto": "", "categoria": categoria_default})
+
+    return_totals = _build_returns_totals_by_sale_period(
+        data.attrs.get("returns_data"),
+        category,
+        allowed_periods,
+    )
 
-    returns_raw = data_pricing.attrs.get("returns_data", pd.DataFrame())
-    returns_filtered = returns_report._filter_returns_dataset(returns_raw, category)
-    return_totals = _build_returns_totals_by_sale_period(returns_filtered, allowed_periods)
+    group_keys = ["periodo", "cd_produto", "cd_anuncio", "ds_anuncio"]
 
-    interval_prices = (
-        data_pricing.groupby("cd_anuncio")["_preco_rbld"].min()
-        .replace([np.inf, -np.inf], np.nan)
+    # as janelas saem dos períodos com chaves completas (os mesmos que o groupby produziria),
+    # então dá para saber antes da agregação se o resultado será vazio
+    complete_keys = data[group_keys].notna().all(axis=1)
+    available_periods = np.sort(pd.unique(data.loc[complete_keys, "periodo"].to_numpy()))
+    windows_ok = True
+    if recent_periods:
+        selected = sorted({str(p) for p in recent_periods})
+        valid_selected = [p for p in selected if p in available_periods]
+        historical_periods = [p for p in available_periods if p not in valid_selected]
+        windows_ok = bool(valid_selected) and bool(historical_periods)
+        recent_periods = np.array(valid_selected)
+        historical_periods = np.array(historical_periods)
+    else:
+        if len(available_periods) <= recent_window:
+            recent_window = max(1, len(available_periods) // 2 or 1)
+        recent_periods = available_periods[-recent_window:]
+        historical_periods = available_periods[:-recent_window]
+
+    # sem janelas válidas o groupby roda sobre zero linhas e cai no retorno vazio logo abaixo
+    # (o preço unitário é recortado junto para manter o mesmo comprimento do escopo)
+    scope = data if windows_ok else data.iloc[:0]
+    scope_preco_rbld = preco_rbld if windows_ok else preco_rbld.iloc[:0]
+    # um único assign acrescenta o preço unitário e passa as chaves a categóricas (códigos inteiros)
+    keyed = scope.assign(
+        _preco_rbld=scope_preco_rbld,
+        _nota=invoice_codes(scope["nr_nota_fiscal"]),
+        **{key: scope[key].astype("category") for key in group_keys},
     )
     grouped = (
-        data_pricing.groupby(["periodo", "cd_produto", "cd_anuncio", "ds_anuncio"], as_index=False)
+        keyed.groupby(group_keys, as_index=False, observed=True)
         .agg(
             qtd_vendida=("qtd_sku", "sum"),
-            pedidos=("nr_nota_fiscal", "nunique"),
+            pedidos=("_nota", "nunique"),
             receita=("rbld", "sum"),
             custo=("custo_produto", "sum"),
             margem_media=("perc_margem_bruta", "mean"),
             preco_min_periodo=("_preco_rbld", "min"),
         )
     )
+    grouped = grouped.astype({key: data[key].dtype for key in group_keys})
 
     if not return_totals.empty:
         grouped = grouped.merge(
@@ -116,7 +153,7 @@ def build_potential_sku_analysis(
         )
 
     if "qtd_devolvida_ret" in grouped.columns:
-        grouped["qtd_devolvida"] = grouped["qtd_devolvida_ret"].fillna(0.0)
+        grouped["qtd_devolvida"] = grouped["qtd_devolvida_ret"].fillna(0.0).astype("float64")
         grouped["pedidos_devolvidos"] = (
             grouped["pedidos_devolvidos_ret"].fillna(0).astype(int)
         )
@@ -140,26 +177,8 @@ def build_potential_sku_analysis(
     grouped["periodo"] = grouped["periodo"].astype(str)
     grouped.sort_values("periodo", inplace=True)
     grouped["preco_min_periodo"] = grouped["preco_min_periodo"].fillna(0).round(2)
-    available_periods = grouped["periodo"].unique()
 
-    if recent_periods:
-        selected = sorted({str(p) for p in recent_periods})
-        valid_selected = [p for p in selected if p in available_periods]
-        if not valid_selected:
-            return {"potenciais": grouped.head(0), "skus_potenciais_mensal": grouped.head(0)}
-        historical_periods = [p for p in available_periods if p not in valid_selected]
-        if not historical_periods:
-            return {"potenciais": grouped.head(0), "skus_potenciais_mensal": grouped.head(0)}
-        recent_periods = np.array(valid_selected)
-        historical_periods = np.array(historical_periods)
-    else:
-        if len(available_periods) <= recent_window:
-            recent_window = max(1, len(available_periods) // 2 or 1)
-        recent_periods = available_periods[-recent_window:]
-        historical_periods = available_periods[:-recent_window]
-
-    recent = _aggregate_window(grouped, recent_periods, suffix="recente")
-    historical = _aggregate_window(grouped, historical_periods, suffix="historico")
+    recent, historical = _aggregate_windows(grouped, recent_periods, historical_periods)
 
     stats = historical.merge(
         recent,
@@ -167,18 +186,15 @@ def build_potential_sku_analysis(
         how="left",
     ).fillna(0)
 
-    stats["queda_abs_qtd"] = stats["qtd_vendida_media_historico"] - stats[
-        "qtd_vendida_media_recente"
-    ]
-    stats["queda_pct_qtd"] = np.where(
-        stats["qtd_vendida_media_historico"] > 0,
-        stats["queda_abs_qtd"] / stats["qtd_vendida_media_historico"],
-        0,
-    )
+    # as três métricas saem dos arrays numpy, sem Series intermediárias alinhando índice a cada passo
+    historico_qtd = stats["qtd_vendida_media_historico"].to_numpy(dtype="float64")
+    queda_abs = historico_qtd - stats["qtd_vendida_media_recente"].to_numpy(dtype="float64")
+    stats["queda_abs_qtd"] = queda_abs
+    stats["queda_pct_qtd"] = safe_div(queda_abs, historico_qtd)
     stats["potencial_score"] = (
-        stats["queda_abs_qtd"].clip(lower=0)
-        * stats["historico_meses_validos"]
-        * (1 - stats["taxa_devolucao_media_historico"])
+        np.maximum(queda_abs, 0)
+        * stats["historico_meses_validos"].to_numpy(dtype="float64")
+        * (1 - stats["taxa_devolucao_media_historico"].to_numpy(dtype="float64"))
     )
 
     eligible = stats.loc[
@@ -194,24 +210,20 @@ def build_potential_sku_analysis(
         & (stats["qtd_vendida_media_historico"] >= median_reference)
         & (stats["queda_pct_qtd"] >= MIN_DROP_RATIO)
         & (stats["taxa_devolucao_media_recente"] <= 0.2)
-    ].copy()
+    ]
 
-    candidatos.sort_values(
+    # nlargest seleciona só o top-K (já ordenado) sem ordenar todos os candidatos
+    selecionados = candidatos.nlargest(
+        rank_size,
         ["potencial_score", "queda_pct_qtd", "qtd_vendida_media_historico"],
-        ascending=[False, False, False],
-        inplace=True,
-    )
-
-    selecionados = candidatos.head(rank_size).copy()
+        keep="first",
+    ).copy()
 
-    if "cd_anuncio" in selecionados.columns:
-        cd_produto_values = selecionados["cd_anuncio"].map(produto_map).fillna("")
-        selecionados.insert(0, "cd_produto", cd_produto_values)
-        if categoria_map is not None:
-            categoria_values = selecionados["cd_anuncio"].map(categoria_map).fillna(categoria_default)
-        else:
-            categoria_values = pd.Series(categoria_default, index=selecionados.index)
-        selecionados.insert(1, "categoria", categoria_values)
+    selected_info = _listing_info_for(listing_lookup, selecionados["cd_anuncio"])
+    selecionados.insert(0, "cd_produto", selected_info["cd_produto"])
+    selecionados.insert(1, "categoria", selected_info["categoria"])
+    selecionados["preco_min_intervalo"] = selected_info["preco_min_intervalo"]
+    selecionados["preco_min_historico_total"] = selected_info["preco_min_historico_total"]
 
     if selecionados.empty:
         historico_focado = grouped.head(0)
@@ -219,40 +231,18 @@ def build_potential_sku_analysis(
         foco = selecionados["cd_anuncio"].unique()
         historico_focado = grouped[grouped["cd_anuncio"].isin(foco)].copy()
 
-    if "cd_anuncio" in historico_focado.columns:
-        if categoria_map is not None:
-            historico_categoria = historico_focado["cd_anuncio"].map(categoria_map).fillna(categoria_default)
-        else:
-            historico_categoria = pd.Series(categoria_default, index=historico_focado.index)
-        insert_pos = (
-            historico_focado.columns.get_loc("cd_produto") + 1
-            if "cd_produto" in historico_focado.columns
-            else 0
-        )
-        historico_focado.insert(insert_pos, "categoria", historico_categoria)
-
-    historico_focado["preco_medio_vendido"] = np.where(
-        historico_focado["qtd_vendida"] > 0,
-        historico_focado["receita"] / historico_focado["qtd_vendida"],
-        0,
-    ).round(2)
-
-    selecionados["preco_min_intervalo"] = pd.to_numeric(
-        selecionados["cd_anuncio"].map(interval_prices), errors="coerce"
-    ).round(2)
-    historico_focado["preco_min_intervalo"] = pd.to_numeric(
-        historico_focado["cd_anuncio"].map(interval_prices), errors="coerce"
-    ).round(2)
-    if historical_prices:
-        selecionados["preco_min_historico_total"] = pd.to_numeric(
-            selecionados["cd_anuncio"].map(historical_prices), errors="coerce"
-        ).round(2)
-        historico_focado["preco_min_historico_total"] = pd.to_numeric(
-            historico_focado["cd_anuncio"].map(historical_prices), errors="coerce"
-        ).round(2)
-    else:
-        selecionados["preco_min_historico_total"] = np.nan
-        historico_focado["preco_min_historico_total"] = np.nan
+    history_info = _listing_info_for(listing_lookup, historico_focado["cd_anuncio"])
+    insert_pos = (
+        historico_focado.columns.get_loc("cd_produto") + 1
+        if "cd_produto" in historico_focado.columns
+        else 0
+    )
+    historico_focado.insert(insert_pos, "categoria", history_info["categoria"])
+    historico_focado["preco_medio_vendido"] = safe_div(historico_focado["receita"], historico_focado["qtd_vendida"])
+    historico_focado["preco_min_intervalo"] = history_info["preco_min_intervalo"]
+    historico_focado["preco_min_historico_total"] = history_info["preco_min_historico_total"]
+    _round_prices(selecionados, ["preco_min_intervalo", "preco_min_historico_total"])
+    _round_prices(historico_focado, ["preco_medio_vendido", "preco_min_intervalo", "preco_min_historico_total"])
 
     selecionados_fmt = format_percentage_columns(
         selecionados,
@@ -273,55 +263,34 @@ def build_potential_sku_analysis(
 
 
 def _build_returns_totals_by_sale_period(
-    returns_df: pd.DataFrame,
+    returns_raw: Optional[pd.DataFrame],
+    category: Optional[str],
     allowed_periods: Set[str],
 ) -> pd.DataFrame:
-    if returns_df is None or returns_df.empty or not allowed_periods:
-        return pd.DataFrame(
-            columns=[
-                "periodo",
-                "cd_produto",
-                "qtd_devolvida_ret",
-                "pedidos_devolvidos_ret",
-                "receita_devolucao_ret",
-            ]
-        )
+    empty = pd.DataFrame(
+        columns=[
+            "periodo",
+            "cd_produto",
+            "qtd_devolvida_ret",
+            "pedidos_devolvidos_ret",
+            "receita_devolucao_ret",
+        ]
+    )
+    if not allowed_periods:
+        return empty
 
-    prepared = returns_report._prepare_returns_dataset(returns_df)
+    # base preparada uma única vez e compartilhada entre categorias; aqui só recebe máscaras
+    prepared = returns_report._get_prepared_returns(returns_raw)
     if prepared.empty:
-        return pd.DataFrame(
-            columns=[
-                "periodo",
-                "cd_produto",
-                "qtd_devolvida_ret",
-                "pedidos_devolvidos_ret",
-                "receita_devolucao_ret",
-            ]
-        )
+        return empty
 
-    period_series = ensure_period_series(
-        prepared,
-        "periodo_venda",
-        "data_venda",
-    )
-    prepared = prepared.copy()
-    prepared["periodo"] = period_series.astype(str)
-    prepared = prepared[prepared["periodo"].isin(allowed_periods)].copy()
+    mask = np.ones(len(prepared), dtype=bool)
+    mask &= prepared["periodo"].isin(allowed_periods).to_numpy()
+    if category:
+        mask &= (prepared["categoria"] == category).to_numpy()
+    prepared = prepared[mask]
     if prepared.empty:
-        return pd.DataFrame(
-            columns=[
-                "periodo",
-                "cd_produto",
-                "qtd_devolvida_ret",
-                "pedidos_devolvidos_ret",
-                "receita_devolucao_ret",
-            ]
-        )
-
-    prepared["cd_produto"] = normalize_product_codes(
-        prepared.get("cd_produto", ""),
-        index=prepared.index,
-    )
+        return empty
 
     totals = build_period_product_totals(
         prepared,
@@ -340,30 +309,31 @@ def _build_returns_totals_by_sale_period(
     return totals
 
 
-def _aggregate_window(df: pd.DataFrame, periods: np.ndarray, suffix: str) -> pd.DataFrame:
-    if len(periods) == 0:
-        return pd.DataFrame(
-            columns=[
-                "cd_anuncio",
-                "ds_anuncio",
-                f"qtd_vendida_media_{suffix}",
-                f"receita_media_{suffix}",
-                f"pedidos_medios_{suffix}",
-                f"taxa_devolucao_media_{suffix}",
-                f"margem_media_{suffix}",
-                f"preco_min_{suffix}",
-                f"{suffix}_meses_validos",
-            ]
-        )
-
-    filtered = df[df["periodo"].isin(periods)].copy()
-    filtered["taxa_devolucao_mensal"] = np.where(
-        filtered["qtd_vendida"] > 0,
-        filtered["qtd_devolvida"] / filtered["qtd_vendida"],
-        0,
+def _aggregate_windows(
+    df: pd.DataFrame,
+    recent_periods: np.ndarray,
+    historical_periods: np.ndarray,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Agrega as janelas recente e histórica num único groupby, com a janela como chave extra."""
+    periods = df["periodo"]
+    window = np.where(
+        periods.isin(recent_periods),
+        np.int8(1),
+        np.where(periods.isin(historical_periods), np.int8(0), np.int8(-1)),
+    )
+    in_window = window >= 0
+    filtered = df.loc[in_window]
+    keys = ["cd_anuncio", "ds_anuncio"]
+    key_dtypes = {key: filtered[key].dtype for key in keys}
+    # a taxa é a média das taxas mensais (não a razão das somas)
+    taxa_mensal = safe_div(filtered["qtd_devolvida"], filtered["qtd_vendida"])
+    filtered = filtered.assign(
+        _janela=window[in_window],
+        taxa_devolucao_mensal=taxa_mensal,
+        **{key: filtered[key].astype("category") for key in keys},
     )
     aggregated = (
-        filtered.groupby(["cd_anuncio", "ds_anuncio"], as_index=False)
+        filtered.groupby([*keys, "_janela"], as_index=False, observed=True)
         .agg(
             qtd_vendida_media=("qtd_vendida", "mean"),
             receita_media=("receita", "mean"),
@@ -373,9 +343,16 @@ def _aggregate_window(df: pd.DataFrame, periods: np.ndarray, suffix: str) -> pd.
             preco_min=("preco_min_periodo", "min"),
             meses_validos=("periodo", "nunique"),
         )
-    )
+    ).astype(key_dtypes)
+
+    recent = _window_frame(aggregated, 1, suffix="recente")
+    historical = _window_frame(aggregated, 0, suffix="historico")
+    return recent, historical
 
-    aggregated = aggregated.rename(
+
+def _window_frame(aggregated: pd.DataFrame, window: int, suffix: str) -> pd.DataFrame:
+    selected = aggregated.loc[aggregated["_janela"] == window].drop(columns="_janela")
+    selected = selected.rename(
         columns={
             "qtd_vendida_media": f"qtd_vendida_media_{suffix}",
             "receita_media": f"receita_media_{suffix}",
@@ -386,16 +363,18 @@ def _aggregate_window(df: pd.DataFrame, periods: np.ndarray, suffix: str) -> pd.
             "meses_validos": f"{suffix}_meses_validos",
         }
     )
-    aggregated[f"preco_min_{suffix}_janela"] = aggregated[
-        f"preco_min_{suffix}_janela"
-    ].round(2)
-    return aggregated
+    selected[f"preco_min_{suffix}_janela"] = selected[f"preco_min_{suffix}_janela"].round(2)
+    return selected.reset_index(drop=True)
 
 
-def _filter_by_category(df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
-    if not category:
-        filtered = df.copy()
-    else:
-        filtered = df[df["categoria"] == category].copy()
-    filtered.attrs = dict(df.attrs)
-    return filtered
+def _listing_info_for(lookup: pd.DataFrame, listings: pd.Series) -> pd.DataFrame:
+    # um único reindex traz todas as colunas do anúncio, alinhadas às linhas do frame de destino
+    info = lookup.reindex(listings.to_numpy())
+    info.index = listings.index
+    return info
+
+
+def _round_prices(df: pd.DataFrame, columns: list[str]) -> None:
+    # um único np.round sobre o bloco de preços em vez de um .round(2) por coluna
+    values = df[columns].to_numpy(dtype="float64", na_value=np.nan)
+    df[columns] = np.round(values, 2)
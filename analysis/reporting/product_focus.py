@@ -9,8 +9,13 @@ from ..formatting import format_percentage_columns
 from . import returns as returns_report
 from .common_returns import (
     build_period_product_totals,
+    collect_period_labels,
     ensure_period_series,
+    filter_by_category,
+    format_period_labels,
+    invoice_codes,
     normalize_product_codes,
+    safe_div,
 )
 
 MONTH_ABBREVIATIONS = {
@@ -28,6 +33,20 @@ MONTH_ABBREVIATIONS = {
     12: "dez",
 }
 
+# posição 0 cobre meses ausentes (NaT); o restante segue o número do mês
+_MONTH_ABBREV_LOOKUP = np.array(["", *(MONTH_ABBREVIATIONS[month] for month in range(1, 13))], dtype=object)
+
+_RETURN_METRIC_COLUMNS = ("itens_devolvidos", "pedidos_devolvidos", "receita_devolucao")
+_METRIC_TEXT_KEYS = ("cd_anuncio", "ds_anuncio", "cd_fabricante", "tp_anuncio", "categoria", "periodo")
+_ROUND2_COLUMNS = [
+    "preco_medio_praticado_unitario",
+    "preco_min_unitario_periodo",
+    "receita",
+    "custo_produto",
+    "receita_devolucao",
+    "lucro_bruto_estimado",
+]
+
 
 def build_product_focus_analysis(
     df: pd.DataFrame,
@@ -36,29 +55,23 @@ def build_product_focus_analysis(
 ) -> Dict[str, pd.DataFrame]:
     """Avalia o desempenho comercial filtrando por categoria ou lista específica de anúncios."""
 
-    data = _filter_by_category(df, category)
-    normalized_codes = (
-        [str(code).strip() for code in product_codes if str(code).strip()]
-        if product_codes
-        else []
-    )
-    focus = (
-        data[data["cd_anuncio"].isin(normalized_codes)].copy()
-        if normalized_codes
-        else data.copy()
-    )
-    focus["data"] = pd.to_datetime(
-        focus.get("data"), dayfirst=True, errors="coerce"
-    )
+    data = filter_by_category(df, category)
+    # strip vetorizado: cada código é convertido uma única vez e vazios saem por máscara
+    codes = pd.Series(product_codes or [], dtype=object).astype(str).str.strip()
+    normalized_codes = codes[codes != ""].unique()
+    focus = data[data["cd_anuncio"].isin(normalized_codes)] if len(normalized_codes) > 0 else data
+    dates = focus.get("data")
+    # o loader já entrega datetime64 normalizado; só texto de outra origem passa pelo parser
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        focus = focus.assign(data=pd.to_datetime(dates, dayfirst=True, errors="coerce", cache=True).dt.normalize())
     focus = focus.dropna(subset=["data"])
-
-    focus["data"] = focus["data"].dt.normalize()
-    focus["cd_produto"] = normalize_product_codes(focus.get("cd_produto", ""))
     period_series = ensure_period_series(focus, "periodo", "data")
-    focus["periodo"] = period_series.astype(str)
-    allowed_periods: Set[str] = {
-        p for p in focus["periodo"].dropna().astype(str) if p and p.lower() != "nat"
-    }
+    # focus pode ser a própria base de entrada: as colunas derivadas entram por assign
+    focus = focus.assign(
+        cd_produto=normalize_product_codes(focus.get("cd_produto", "")),
+        periodo=format_period_labels(period_series),
+    )
+    allowed_periods = collect_period_labels(focus["periodo"])
 
     returns_overall, returns_monthly, returns_daily = _compute_returns_metrics(
         focus,
@@ -66,29 +79,33 @@ def build_product_focus_analysis(
         allowed_periods=allowed_periods,
     )
 
+    # preço unitário e chaves categóricas são montados uma vez e servem aos três agrupamentos
+    metrics_base, key_dtypes = _prepare_metrics_frame(focus)
     resumo = _aggregate_metrics(
-        focus,
+        metrics_base,
         group_cols=["cd_anuncio", "ds_anuncio", "cd_fabricante", "tp_anuncio", "categoria"],
+        key_dtypes=key_dtypes,
     )
     resumo.sort_values(["receita", "itens_vendidos"], ascending=[False, False], inplace=True)
 
     analise_diaria = _aggregate_metrics(
-        focus,
+        metrics_base,
         group_cols=["data", "cd_anuncio", "ds_anuncio", "cd_fabricante", "tp_anuncio", "categoria"],
+        key_dtypes=key_dtypes,
     )
     analise_diaria.sort_values(["data", "cd_anuncio"], inplace=True)
 
     analise_mensal = _aggregate_metrics(
-        focus,
+        metrics_base,
         group_cols=["periodo", "cd_anuncio", "ds_anuncio", "cd_fabricante", "tp_anuncio", "categoria"],
+        key_dtypes=key_dtypes,
     )
     analise_mensal.sort_values(["periodo", "cd_anuncio"], inplace=True)
     analise_mensal["periodo"] = analise_mensal["periodo"].astype(str)
     periodo_dt = pd.to_datetime(analise_mensal["periodo"], format="%Y-%m", errors="coerce")
     analise_mensal["ano"] = pd.Series(periodo_dt.dt.year, index=analise_mensal.index, dtype="Int64")
-    analise_mensal["mes_abrev"] = periodo_dt.dt.month.apply(
-        lambda x: MONTH_ABBREVIATIONS.get(int(x), "") if not pd.isna(x) else ""
-    )
+    months = periodo_dt.dt.month.fillna(0).to_numpy(dtype="int64")
+    analise_mensal["mes_abrev"] = _MONTH_ABBREV_LOOKUP[months]
 
     resumo = _merge_return_totals(resumo, returns_overall, key_cols=["cd_produto"])
     analise_diaria = _merge_return_totals(
@@ -102,10 +119,6 @@ def build_product_focus_analysis(
         key_cols=["periodo", "cd_produto"],
     )
 
-    resumo_fmt = format_percentage_columns(resumo, ["margem_media", "taxa_devolucao"])
-    diaria_fmt = format_percentage_columns(analise_diaria, ["margem_media", "taxa_devolucao"])
-    mensal_fmt = format_percentage_columns(analise_mensal, ["margem_media", "taxa_devolucao"])
-
     resumo_order = [
         "categoria",
         "cd_anuncio",
@@ -177,7 +190,7 @@ def build_product_focus_analysis(
         "taxa_devolucao",
     ]
 
-    for frame in (resumo_fmt, diaria_fmt, mensal_fmt):
+    for frame in (resumo, analise_diaria, analise_mensal):
         if "categoria" not in frame.columns:
             frame["categoria"] = frame.get("categoria", "").fillna("")
         else:
@@ -185,9 +198,19 @@ def build_product_focus_analysis(
         if "cd_produto" not in frame.columns and "cd_anuncio" in frame.columns:
             frame["cd_produto"] = ""
 
-    resumo_fmt = resumo_fmt[[col for col in resumo_order if col in resumo_fmt.columns]]
-    diaria_fmt = diaria_fmt[[col for col in diaria_order if col in diaria_fmt.columns]]
-    mensal_fmt = mensal_fmt[[col for col in mensal_order if col in mensal_fmt.columns]]
+    # projeta antes de normalizar percentuais: a cópia feita pela formatação cobre só as colunas exportadas
+    resumo_fmt = format_percentage_columns(
+        resumo[[col for col in resumo_order if col in resumo.columns]],
+        ["margem_media", "taxa_devolucao"],
+    )
+    diaria_fmt = format_percentage_columns(
+        analise_diaria[[col for col in diaria_order if col in analise_diaria.columns]],
+        ["margem_media", "taxa_devolucao"],
+    )
+    mensal_fmt = format_percentage_columns(
+        analise_mensal[[col for col in mensal_order if col in analise_mensal.columns]],
+        ["margem_media", "taxa_devolucao"],
+    )
     return {
         "resumo_produtos": resumo_fmt,
         "analise_diaria": diaria_fmt,
@@ -195,19 +218,29 @@ def build_product_focus_analysis(
     }
 
 
+def _prepare_metrics_frame(df: pd.DataFrame) -> tuple[pd.DataFrame, Dict[str, object]]:
+    """Acrescenta o preço unitário e converte as chaves de texto em categóricas (códigos inteiros)."""
+    receita_total = pd.to_numeric(df.get("rbld", 0), errors="coerce")
+    quantidade = pd.to_numeric(df.get("qtd_sku", 0), errors="coerce")
+    preco_rbld_unitario = np.where(quantidade > 0, receita_total / quantidade, np.nan)
+    preco_rbld_unitario = np.where(np.isfinite(preco_rbld_unitario), preco_rbld_unitario, np.nan)
+    text_keys = [col for col in _METRIC_TEXT_KEYS if col in df.columns]
+    key_dtypes = {col: df[col].dtype for col in text_keys}
+    prepared = df.assign(
+        _preco_rbld=preco_rbld_unitario,
+        _nota=invoice_codes(df["nr_nota_fiscal"]),
+        **{col: df[col].astype("category") for col in text_keys},
+    )
+    return prepared, key_dtypes
+
+
 def _aggregate_metrics(
     df: pd.DataFrame,
     group_cols: List[str],
+    key_dtypes: Dict[str, object],
 ) -> pd.DataFrame:
-    working = df.copy()
-    receita_total = pd.to_numeric(working.get("rbld", 0), errors="coerce")
-    quantidade = pd.to_numeric(working.get("qtd_sku", 0), errors="coerce")
-    preco_rbld_unitario = np.where(quantidade > 0, receita_total / quantidade, np.nan)
-    preco_rbld_unitario = np.where(np.isfinite(preco_rbld_unitario), preco_rbld_unitario, np.nan)
-    working = working.assign(_preco_rbld=preco_rbld_unitario)
-
     aggregations = {
-        "qtd_pedidos": ("nr_nota_fiscal", "nunique"),
+        "qtd_pedidos": ("_nota", "nunique"),
         "itens_vendidos": ("qtd_sku", "sum"),
         "receita": ("rbld", "sum"),
         "custo_produto": ("custo_produto", "sum"),
@@ -220,34 +253,28 @@ def _aggregate_metrics(
     }
 
     for info_col in ("cd_produto", "categoria"):
-        if info_col in working.columns and info_col not in group_cols:
+        if info_col in df.columns and info_col not in group_cols:
             aggregations[info_col] = (info_col, "first")
 
-    aggregated = working.groupby(group_cols, as_index=False).agg(**aggregations)
-
-    aggregated["preco_medio_praticado_unitario"] = aggregated["preco_medio_praticado_unitario"].fillna(0).round(2)
-    aggregated["preco_min_unitario_periodo"] = aggregated["preco_min_unitario_periodo"].fillna(0).round(2)
-    aggregated["receita"] = aggregated["receita"].round(2)
-    aggregated["custo_produto"] = aggregated["custo_produto"].round(2)
-    aggregated["receita_devolucao"] = aggregated["receita_devolucao"].round(2)
-    aggregated["lucro_bruto_estimado"] = aggregated["lucro_bruto_estimado"].round(2)
-
-    aggregated["ticket_medio"] = np.where(
-        aggregated["qtd_pedidos"] > 0,
-        aggregated["receita"] / aggregated["qtd_pedidos"],
-        0,
-    ).round(2)
-    aggregated["preco_medio_vendido_unitario"] = np.where(
-        aggregated["itens_vendidos"] > 0,
-        aggregated["receita"] / aggregated["itens_vendidos"],
-        0,
-    ).round(2)
-    aggregated["taxa_devolucao"] = np.where(
-        aggregated["itens_vendidos"] > 0,
-        aggregated["itens_devolvidos"] / aggregated["itens_vendidos"],
-        0,
+    # as chaves já chegam categóricas; no resultado voltam ao tipo original. Os grupos seguem
+    # ordenados pela chave completa: é essa ordem que desempata as ordenações de cada relatório
+    aggregated = (
+        df.groupby(group_cols, as_index=False, observed=True, sort=True)
+        .agg(**aggregations)
+        .astype({col: key_dtypes[col] for col in group_cols if col in key_dtypes})
     )
 
+    aggregated = aggregated.fillna({"preco_medio_praticado_unitario": 0, "preco_min_unitario_periodo": 0})
+    # um único np.round sobre o bloco de valores monetários em vez de um .round(2) por coluna
+    money = aggregated[_ROUND2_COLUMNS].to_numpy(dtype="float64", na_value=np.nan)
+    aggregated[_ROUND2_COLUMNS] = np.round(money, 2)
+
+    receita = aggregated["receita"].to_numpy(dtype="float64")
+    itens_vendidos = aggregated["itens_vendidos"].to_numpy(dtype="float64")
+    aggregated["ticket_medio"] = np.round(safe_div(receita, aggregated["qtd_pedidos"]), 2)
+    aggregated["preco_medio_vendido_unitario"] = np.round(safe_div(receita, itens_vendidos), 2)
+    aggregated["taxa_devolucao"] = safe_div(aggregated["itens_devolvidos"], itens_vendidos)
+
     ordered_columns = [
         *(col for col in group_cols if col in aggregated.columns),
         *(col for col in ("cd_produto", "ds_produto") if col in aggregated.columns),
@@ -274,13 +301,13 @@ def _aggregate_metrics(
     return aggregated
 
 
-def _filter_by_category(df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
-    if not category:
-        filtered = df.copy()
-    else:
-        filtered = df[df["categoria"] == category].copy()
-    filtered.attrs = dict(df.attrs)
-    return filtered
+def _empty_returns_metrics() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    # frames novos a cada chamada: quem recebe pode acrescentar colunas sem afetar outras chamadas
+    return (
+        pd.DataFrame(columns=["cd_produto", *_RETURN_METRIC_COLUMNS]),
+        pd.DataFrame(columns=["periodo", "cd_produto", *_RETURN_METRIC_COLUMNS]),
+        pd.DataFrame(columns=["data", "cd_produto", *_RETURN_METRIC_COLUMNS]),
+    )
 
 
 def _compute_returns_metrics(
@@ -289,55 +316,33 @@ def _compute_returns_metrics(
     category: Optional[str],
     allowed_periods: Set[str],
 ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    returns_raw = focus_df.attrs.get("returns_data", pd.DataFrame())
-    returns_filtered = returns_report._filter_returns_dataset(returns_raw, category)
-    prepared = returns_report._prepare_returns_dataset(returns_filtered)
-    if prepared is None or prepared.empty:
-        return (
-            pd.DataFrame(columns=["cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-            pd.DataFrame(columns=["periodo", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-            pd.DataFrame(columns=["data", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-        )
-
-    prepared = prepared.copy()
-    prepared["cd_produto"] = normalize_product_codes(prepared.get("cd_produto", ""), index=prepared.index)
-
-    product_scope = set(focus_df.get("cd_produto", pd.Series(dtype=str)).dropna().astype(str))
-    if product_scope:
-        prepared = prepared[prepared["cd_produto"].isin(product_scope)].copy()
-        if prepared.empty:
-            return (
-                pd.DataFrame(columns=["cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["periodo", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["data", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-            )
+    prepared = returns_report._get_prepared_returns(focus_df.attrs.get("returns_data"))
+    if prepared.empty:
+        return _empty_returns_metrics()
+
+    # a base preparada é compartilhada entre relatórios: categoria, produtos, datas e períodos
+    # viram uma única máscara e um único recorte, sem cópias intermediárias
+    mask = np.ones(len(prepared), dtype=bool)
+    if category:
+        mask &= (prepared["categoria"] == category).to_numpy()
+
+    # cd_produto já chega normalizado nas duas bases
+    product_scope = focus_df.get("cd_produto", pd.Series(dtype=str)).dropna().unique()
+    if len(product_scope) > 0:
+        mask &= prepared["cd_produto"].isin(product_scope).to_numpy()
+
+    if not focus_df.empty:
+        focus_dates = focus_df["data"]
+        min_date = focus_dates.min()
+        max_date = focus_dates.max()
+        mask &= ((prepared["data"] >= min_date) & (prepared["data"] <= max_date)).to_numpy()
 
-    focus_dates = pd.to_datetime(focus_df.get("data"), errors="coerce")
-    min_date = focus_dates.min() if not focus_df.empty else None
-    max_date = focus_dates.max() if not focus_df.empty else None
-
-    prepared["data"] = pd.to_datetime(prepared.get("data_venda"), errors="coerce").dt.normalize()
-    if min_date is not None and max_date is not None:
-        prepared = prepared[
-            (prepared["data"] >= min_date)
-            & (prepared["data"] <= max_date)
-        ].copy()
-        if prepared.empty:
-            return (
-                pd.DataFrame(columns=["cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["periodo", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["data", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-            )
-
-    prepared["periodo"] = ensure_period_series(prepared, "periodo_venda", "data_venda").astype(str)
     if allowed_periods:
-        prepared = prepared[prepared["periodo"].isin(allowed_periods)].copy()
-        if prepared.empty:
-            return (
-                pd.DataFrame(columns=["cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["periodo", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-                pd.DataFrame(columns=["data", "cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]),
-            )
+        mask &= prepared["periodo"].isin(allowed_periods).to_numpy()
+
+    prepared = prepared[mask]
+    if prepared.empty:
+        return _empty_returns_metrics()
 
     monthly_totals = build_period_product_totals(
         prepared,
@@ -355,12 +360,10 @@ def _compute_returns_metrics(
     )
 
     if monthly_totals.empty:
-        overall_totals = pd.DataFrame(
-            columns=["cd_produto", "itens_devolvidos", "pedidos_devolvidos", "receita_devolucao"]
-        )
+        overall_totals = pd.DataFrame(columns=["cd_produto", *_RETURN_METRIC_COLUMNS])
     else:
         overall_totals = (
-            monthly_totals.groupby("cd_produto", as_index=False)
+            monthly_totals.groupby("cd_produto", as_index=False, sort=False)
             .agg(
                 itens_devolvidos=("itens_devolvidos", "sum"),
                 pedidos_devolvidos=("pedidos_devolvidos", "sum"),
@@ -369,11 +372,13 @@ def _compute_returns_metrics(
         )
         overall_totals["pedidos_devolvidos"] = overall_totals["pedidos_devolvidos"].fillna(0).astype(int)
 
+    # pedidos de devolução também contam distintos sobre códigos numéricos em vez de texto
     daily_totals = (
-        prepared.groupby(["data", "cd_produto"], as_index=False)
+        prepared.assign(_pedido=invoice_codes(prepared["pedido_devolucao_id"]))
+        .groupby(["data", "cd_produto"], as_index=False, sort=False)
         .agg(
             itens_devolvidos=("qtd_sku", "sum"),
-            pedidos_devolvidos=("pedido_devolucao_id", "nunique"),
+            pedidos_devolvidos=("_pedido", "nunique"),
             receita_devolucao=("devolucao_receita_bruta", "sum"),
         )
     )
@@ -404,11 +409,7 @@ def _merge_return_totals(
             df["pedidos_devolvidos"] = 0
         if "receita_devolucao" not in df.columns:
             df["receita_devolucao"] = 0.0
-        df["taxa_devolucao"] = np.where(
-            df.get("itens_vendidos", 0) > 0,
-            df.get("itens_devolvidos", 0) / df.get("itens_vendidos", 1),
-            0,
-        )
+        df["taxa_devolucao"] = safe_div(df["itens_devolvidos"], df.get("itens_vendidos", 0))
         return df
 
     working = df.drop(
@@ -425,23 +426,25 @@ def _merge_return_totals(
         working["pedidos_devolvidos"] = 0
         working["receita_devolucao"] = 0.0
     else:
-        working = working.merge(totals, on=key_cols, how="left")
+        # totais têm chave única: um reindex alinha os valores às linhas sem o merge completo
+        lookup = (
+            pd.MultiIndex.from_frame(working[key_cols])
+            if len(key_cols) > 1
+            else pd.Index(working[key_cols[0]])
+        )
+        aligned = totals.set_index(key_cols).reindex(lookup)
         for col, default, dtype in (
             ("itens_devolvidos", 0.0, float),
-            ("receita_devolucao", 0.0, float),
             ("pedidos_devolvidos", 0, int),
+            ("receita_devolucao", 0.0, float),
         ):
-            if col not in working.columns:
+            if col not in aligned.columns:
                 working[col] = default
             else:
-                working[col] = working[col].fillna(default).astype(dtype)
+                working[col] = aligned[col].fillna(default).astype(dtype).to_numpy()
 
     working["itens_devolvidos"] = working["itens_devolvidos"].astype(float).round(2)
     working["receita_devolucao"] = working["receita_devolucao"].astype(float).round(2)
-    working["taxa_devolucao"] = np.where(
-        working.get("itens_vendidos", 0) > 0,
-        working["itens_devolvidos"] / working["itens_vendidos"],
-        0,
-    )
+    working["taxa_devolucao"] = safe_div(working["itens_devolvidos"], working.get("itens_vendidos", 0))
 
     return working
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import weakref
 from typing import Dict, Optional, Set
 
 import numpy as np
@@ -9,6 +10,8 @@ from ..formatting import format_percentage_columns
 from .common_returns import (
     build_period_product_totals,
     ensure_period_series,
+    filter_by_category,
+    format_period_labels,
     normalize_product_codes,
 )
 
@@ -27,6 +30,13 @@ MONTH_NAMES = {
     12: ("Dezembro", "Dez"),
 }
 
+# posição 0 cobre meses ausentes (NaT); o restante segue o número do mês
+_MONTH_FULL_LOOKUP = np.array(["", *(MONTH_NAMES[month][0] for month in range(1, 13))], dtype=object)
+_MONTH_SHORT_LOOKUP = np.array(["", *(MONTH_NAMES[month][1] for month in range(1, 13))], dtype=object)
+
+# base de devoluções já preparada, indexada pela identidade do frame bruto em df.attrs
+_PREPARED_RETURNS_CACHE: Dict[int, tuple[weakref.ref, pd.DataFrame]] = {}
+
 RESULT_COLUMNS = [
     "ano",
     "mes_extenso",
@@ -46,7 +56,7 @@ def build_return_analysis(
 ) -> Dict[str, pd.DataFrame]:
     """Entrega visões mensais de devolução usando venda e data do retorno."""
     # df aqui é a aba de VENDAS (base principal)
-    sales_base = _filter_by_category(df, category)
+    sales_base = filter_by_category(df, category)
     returns_raw = df.attrs.get("returns_data", pd.DataFrame())
     returns_filtered = _filter_returns_dataset(returns_raw, category)
 
@@ -80,15 +90,6 @@ def build_return_analysis(
     }
 
 
-def _filter_by_category(df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
-    if not category:
-        filtered = df.copy()
-    else:
-        filtered = df[df["categoria"] == category].copy()
-    filtered.attrs = dict(df.attrs)
-    return filtered
-
-
 def _filter_returns_dataset(returns_df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
     if returns_df is None or returns_df.empty:
         return pd.DataFrame()
@@ -150,6 +151,35 @@ def _prepare_returns_dataset(
     return working
 
 
+def _get_prepared_returns(returns_df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Prepara a base de devoluções uma única vez por frame bruto, já com `data` e `periodo`.
+
+    O resultado é compartilhado entre chamadas: quem o usa deve apenas filtrá-lo, nunca alterá-lo.
+    """
+    if returns_df is None or returns_df.empty:
+        return pd.DataFrame()
+
+    key = id(returns_df)
+    cached = _PREPARED_RETURNS_CACHE.get(key)
+    # o weakref confirma que o id não foi reaproveitado por outro frame
+    if cached is not None and cached[0]() is returns_df:
+        return cached[1]
+
+    prepared = _prepare_returns_dataset(returns_df)
+    sale_dates = prepared.get("data_venda")
+    if pd.api.types.is_datetime64_any_dtype(sale_dates):
+        # o loader já entrega data_venda convertida e normalizada
+        prepared["data"] = sale_dates
+    else:
+        prepared["data"] = pd.to_datetime(sale_dates, errors="coerce", cache=True).dt.normalize()
+    prepared["periodo"] = format_period_labels(prepared["periodo_venda"])
+    _PREPARED_RETURNS_CACHE[key] = (
+        weakref.ref(returns_df, lambda _ref, key=key: _PREPARED_RETURNS_CACHE.pop(key, None)),
+        prepared,
+    )
+    return prepared
+
+
 def _build_return_view(
     returns_df: pd.DataFrame,
     *,
@@ -174,7 +204,7 @@ def _build_return_view(
         return _empty_result()
 
     # usar o periodo solicitado (venda ou devolução)
-    working["periodo"] = working[period_column].astype(str)
+    working["periodo"] = format_period_labels(working[period_column])
     if period_filter:
         working = working[working["periodo"].isin(period_filter)].copy()
         if working.empty:
@@ -283,9 +313,9 @@ def _append_month_labels(df: pd.DataFrame) -> pd.DataFrame:
         period_index = pd.PeriodIndex(pd.to_datetime(df["periodo"], errors="coerce").to_period("M"))
 
     df["ano"] = period_index.year
-    month_numbers = period_index.month
-    df["mes_extenso"] = [MONTH_NAMES.get(m, ("", ""))[0] for m in month_numbers]
-    df["mes_abreviado"] = [MONTH_NAMES.get(m, ("", ""))[1] for m in month_numbers]
+    month_numbers = np.nan_to_num(np.asarray(period_index.month, dtype="float64"), nan=0).astype("int64")
+    df["mes_extenso"] = _MONTH_FULL_LOOKUP[month_numbers]
+    df["mes_abreviado"] = _MONTH_SHORT_LOOKUP[month_numbers]
     return df
 
 
@@ -9,7 +9,10 @@ from ..formatting import format_percentage_columns
 from . import returns as returns_report
 from .common_returns import (
     build_period_product_totals,
+    collect_period_labels,
     ensure_period_series,
+    filter_by_category,
+    format_period_labels,
     normalize_product_codes,
 )
 
@@ -29,6 +32,9 @@ MONTH_ABBREVIATIONS = {
     12: "dez",
 }
 
+# posição 0 cobre meses ausentes (NaT); o restante segue o número do mês
+_MONTH_ABBREV_LOOKUP = np.array(["", *(MONTH_ABBREVIATIONS[month] for month in range(1, 13))], dtype=object)
+
 
 def build_top_history_analysis(
     df: pd.DataFrame,
@@ -37,13 +43,14 @@ def build_top_history_analysis(
     historical_prices: Optional[Dict[str, float]] = None,
 ) -> Dict[str, pd.DataFrame]:
     """Gera ranking dos SKUs com melhor consistência histórica."""
-    data = _filter_by_category(df, category)
-    data["cd_produto"] = normalize_product_codes(data.get("cd_produto", ""))
+    data = filter_by_category(df, category)
     period_series = ensure_period_series(data, "periodo", "data")
-    data["periodo"] = period_series.astype(str)
-    allowed_periods: Set[str] = {
-        p for p in data["periodo"].dropna().astype(str) if p and p.lower() != "nat"
-    }
+    # o recorte pode ser a própria base de entrada: as colunas derivadas entram por assign
+    data = data.assign(
+        cd_produto=normalize_product_codes(data.get("cd_produto", "")),
+        periodo=format_period_labels(period_series),
+    )
+    allowed_periods = collect_period_labels(data["periodo"])
     receita_total = pd.to_numeric(data.get("rbld", 0), errors="coerce")
     quantidade = pd.to_numeric(data.get("qtd_sku", 0), errors="coerce")
     preco_rbld_unitario = np.where(quantidade > 0, receita_total / quantidade, np.nan)
@@ -157,9 +164,8 @@ def build_top_history_analysis(
     detalhes["categoria"] = detalhes.get("categoria", categoria_default).fillna(categoria_default)
     periodo_datetime = pd.to_datetime(detalhes["periodo"], format="%Y-%m", errors="coerce")
     detalhes["ano"] = pd.Series(periodo_datetime.dt.year, index=detalhes.index, dtype="Int64")
-    detalhes["mes_abrev"] = periodo_datetime.dt.month.apply(
-        lambda x: MONTH_ABBREVIATIONS.get(int(x), "") if not pd.isna(x) else ""
-    )
+    months = periodo_datetime.dt.month.fillna(0).to_numpy(dtype="int64")
+    detalhes["mes_abrev"] = _MONTH_ABBREV_LOOKUP[months]
     detalhes["preco_min_unitario_historico_total"] = pd.to_numeric(
         detalhes["cd_anuncio"].map(historical_prices), errors="coerce"
     ).round(2) if historical_prices else np.nan
@@ -272,7 +278,7 @@ def _compute_returns_totals(
             )
             return empty_overall, empty_monthly
 
-    prepared["periodo"] = ensure_period_series(prepared, "periodo_venda", "data_venda").astype(str)
+    prepared["periodo"] = format_period_labels(ensure_period_series(prepared, "periodo_venda", "data_venda"))
     if allowed_periods:
         prepared = prepared[prepared["periodo"].isin(allowed_periods)].copy()
         if prepared.empty:
@@ -325,12 +331,3 @@ def _compute_returns_totals(
     overall_totals["pedidos_devolvidos_total"] = overall_totals["pedidos_devolvidos_total"].fillna(0).astype(int)
 
     return overall_totals, monthly_totals
-
-
-def _filter_by_category(df: pd.DataFrame, category: Optional[str]) -> pd.DataFrame:
-    if not category:
-        filtered = df.copy()
-    else:
-        filtered = df[df["categoria"] == category].copy()
-    filtered.attrs = dict(df.attrs)
-    return filtered
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.data_loader import load_sales_dataset
+
+CATEGORIES = ("Casa", "Moda")
+
+
+def _build_workbook(path, missing_date: bool = False) -> None:
+    rng = np.random.default_rng(7)
+    listings = [f"AN{i:03d}" for i in range(12)]
+    dates = pd.date_range("2023-07-01", "2024-06-30", freq="D")
+    sales = []
+    for idx in range(1500):
+        listing = listings[idx % len(listings)]
+        day = dates[int(rng.integers(0, len(dates)))]
+        # metade dos anúncios some nos últimos meses para gerar candidatos a potencial
+        if listings.index(listing) % 4 < 2 and day >= pd.Timestamp("2024-04-01"):
+            day -= pd.DateOffset(months=6)
+        price = round(float(rng.uniform(10, 200)), 2)
+        qty = int(rng.integers(1, 5))
+        sales.append(
+            {
+                "DATA_VENDA": day.strftime("%d/%m/%Y"),
+                "NOTA_FISCAL_VENDA": f"NF{idx // 2:05d}",
+                "CATEGORIA": CATEGORIES[listings.index(listing) % len(CATEGORIES)],
+                "CD_ANUNCIO": listing,
+                "DS_ANUNCIO": f"Anuncio {listing}",
+                "CD_PRODUTO": str(1000 + listings.index(listing)),
+                "CD_FABRICANTE": "FAB1",
+                "DS_PRODUTO": f"Produto {listing}",
+                "TP_ANUNCIO": "Classico",
+                "Custo Medio$": str(round(price * 0.5, 2)).replace(".", ","),
+                "Preco Medio Unit$": str(price).replace(".", ","),
+                "Unidades": str(qty),
+                "Perc Margem Bruta% RBLD": "30,0%",
+                "Receita Bruta (-) Devoluções Tot$": str(round(price * qty, 2)).replace(".", ","),
+                "TP_REGISTRO": "VENDA",
+            }
+        )
+    sales_df = pd.DataFrame(sales)
+    returns_df = sales_df.iloc[::15].copy()
+    returns_df["DATA_DEVOLUCAO"] = returns_df["DATA_VENDA"]
+    returns_df["NOTA_FISCAL_DEVOLUCAO"] = [f"ND{idx:05d}" for idx in range(len(returns_df))]
+    returns_df["Unidades"] = "1"
+    returns_df["Devolução Receita Bruta Tot$"] = returns_df["Preco Medio Unit$"]
+    returns_df["TP_REGISTRO"] = "DEVOLUCAO"
+    returns_df = returns_df.drop(columns=["Perc Margem Bruta% RBLD", "Receita Bruta (-) Devoluções Tot$"])
+    if missing_date:
+        sales_df.loc[0, "DATA_VENDA"] = None
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        sales_df.to_excel(writer, sheet_name="VENDA", index=False)
+        returns_df.to_excel(writer, sheet_name="DEVOLUCAO", index=False)
+
+
+@pytest.fixture(scope="session")
+def sales_dataset(tmp_path_factory) -> pd.DataFrame:
+    path = tmp_path_factory.mktemp("dados") / "vendas.xlsx"
+    _build_workbook(path)
+    return load_sales_dataset(path, enable_cache=False)
+
+
+@pytest.fixture(scope="session")
+def sales_dataset_missing_date(tmp_path_factory) -> pd.DataFrame:
+    path = tmp_path_factory.mktemp("dados") / "vendas_sem_data.xlsx"
+    _build_workbook(path, missing_date=True)
+    return load_sales_dataset(path, enable_cache=False)
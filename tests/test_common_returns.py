@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from analysis.reporting.common_returns import (
+    collect_period_labels,
+    filter_by_category,
+    format_period_labels,
+    normalize_product_codes,
+)
+
+
+@pytest.mark.parametrize("dtype", [object, "category"])
+def test_filter_by_category_matches_text_and_categorical(dtype):
+    df = pd.DataFrame(
+        {"categoria": pd.Series(["Casa", "Moda", None, "Casa"], dtype=dtype), "valor": [1, 2, 3, 4]}
+    )
+    df.attrs["returns_data"] = "marcador"
+
+    filtered = filter_by_category(df, "Casa", ["valor", "categoria", "ausente"])
+
+    assert filtered["valor"].tolist() == [1, 4]
+    assert list(filtered.columns) == ["valor", "categoria"]
+    assert filtered.attrs["returns_data"] == "marcador"
+    assert filter_by_category(df, "Brinquedos").empty
+    assert len(filter_by_category(df, None)) == 4
+
+
+def test_format_period_labels_keeps_missing_periods_missing():
+    periods = pd.Series(pd.PeriodIndex(["2024-01", None, "2024-03", "2024-01"], freq="M"))
+
+    labels = format_period_labels(periods)
+
+    assert labels.tolist()[0::2] == ["2024-01", "2024-03"]
+    assert labels.isna().tolist() == [False, True, False, False]
+    assert collect_period_labels(labels) == {"2024-01", "2024-03"}
+
+
+def test_normalize_product_codes_returns_one_dtype_for_every_input_type():
+    inputs = [
+        pd.Series([1001, 1002], dtype="int64"),
+        pd.Series([1001.0, None]),
+        pd.Series(["1001.0", "nan"], dtype=object),
+    ]
+
+    results = [normalize_product_codes(series) for series in inputs]
+
+    assert results[0].tolist() == ["1001", "1002"]
+    assert results[1].tolist() == ["1001", ""]
+    assert results[2].tolist() == ["1001", ""]
+    assert len({str(result.dtype) for result in results}) == 1
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from openpyxl import load_workbook
+
+from analysis import exporters
+
+
+def _frames() -> dict[str, pd.DataFrame]:
+    grande = pd.DataFrame(
+        {
+            "data": pd.to_datetime(["2024-01-05", None, "2024-03-10", "2024-04-01"]),
+            "cd_anuncio": ["AN1", "AN2", np.nan, "AN4"],
+            "receita": [10.5, 20.0, None, 7.25],
+        }
+    )
+    pequena = pd.DataFrame({"data": pd.to_datetime(["2024-02-01"]), "valor": [1.0]})
+    return {"grande": grande, "pequena": pequena}
+
+
+def test_export_large_sheet_keeps_dates_and_small_sheet_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(exporters, "CONSTANT_MEMORY_ROW_THRESHOLD", 2)
+
+    path = exporters.export_to_excel(_frames(), "teste", output_dir=tmp_path)
+
+    workbook = load_workbook(path)
+    grande = workbook["grande"]
+    assert [cell.value for cell in grande[1]] == ["data", "cd_anuncio", "receita"]
+    assert grande["A2"].value == datetime(2024, 1, 5)
+    assert grande["A2"].number_format == "YYYY-MM-DD HH:MM:SS"
+    assert grande["A3"].value is None
+    assert grande["C5"].value == 7.25
+    assert grande["B4"].value is None
+    assert grande.auto_filter.ref == "A1:C5"
+    assert not grande.tables
+
+    pequena = workbook["pequena"]
+    assert pequena["A2"].value == datetime(2024, 2, 1)
+    assert list(pequena.tables) == ["pequena"]
+
+    roundtrip = pd.read_excel(path, sheet_name="grande")
+    expected = _frames()["grande"]
+    pd.testing.assert_frame_equal(roundtrip, expected, check_dtype=False)
+
+
+def test_export_without_large_sheets_uses_tables(tmp_path):
+    path = exporters.export_to_excel(_frames(), "teste", output_dir=tmp_path)
+
+    workbook = load_workbook(path)
+    assert list(workbook["grande"].tables) == ["grande"]
+    assert list(workbook["pequena"].tables) == ["pequena"]
+
+
+def test_export_skips_empty_text_cells(tmp_path, monkeypatch):
+    frame = pd.DataFrame({"cd_anuncio": ["AN1", "", None], "ds_anuncio": ["", "Anuncio", "x"]})
+
+    path = exporters.export_to_excel({"normal": frame}, "teste", output_dir=tmp_path)
+    monkeypatch.setattr(exporters, "CONSTANT_MEMORY_ROW_THRESHOLD", 1)
+    streamed = exporters.export_to_excel({"grande": frame}, "teste_grande", output_dir=tmp_path)
+
+    for file_path, sheet in ((path, "normal"), (streamed, "grande")):
+        worksheet = load_workbook(file_path)[sheet]
+        assert worksheet["A2"].value == "AN1"
+        assert worksheet["A3"].value is None
+        assert worksheet["B2"].value is None
+        assert worksheet["B3"].value == "Anuncio"
+
+
+def test_export_writes_infinite_values_and_dates_like_to_excel(tmp_path, monkeypatch):
+    frame = pd.DataFrame(
+        {
+            "data": pd.to_datetime(["2024-01-05", "2024-02-10"]),
+            "taxa": [np.inf, 0.5],
+            "misto": [-np.inf, "texto"],
+        }
+    )
+    reference = tmp_path / "referencia.xlsx"
+    frame.to_excel(reference, sheet_name="dados", index=False, engine="xlsxwriter")
+
+    path = exporters.export_to_excel({"dados": frame}, "teste", output_dir=tmp_path)
+    monkeypatch.setattr(exporters, "CONSTANT_MEMORY_ROW_THRESHOLD", 1)
+    streamed = exporters.export_to_excel({"dados": frame}, "teste_grande", output_dir=tmp_path)
+
+    expected = load_workbook(reference)["dados"]
+    for file_path in (path, streamed):
+        worksheet = load_workbook(file_path)["dados"]
+        for cell in ("A2", "B2", "B3", "C2", "C3"):
+            assert worksheet[cell].value == expected[cell].value
+        assert worksheet["A2"].number_format == expected["A2"].number_format
+
+
+def test_constant_memory_worksheet_is_isolated(tmp_path):
+    workbook = xlsxwriter.Workbook(str(tmp_path / "isolado.xlsx"))
+
+    streamed = exporters._add_constant_memory_worksheet(workbook, "grande")
+    regular = workbook.add_worksheet("pequena")
+
+    assert streamed.constant_memory
+    assert not regular.constant_memory
+    assert workbook.constant_memory is False
+    streamed.write_row(0, 0, ["a", "b"])
+    streamed.write_row(1, 0, [1, 2])
+    regular.write_row(0, 0, ["a"])
+    regular.add_table(0, 0, 1, 0, {"columns": [{"header": "a"}]})
+    workbook.close()
+
+    reloaded = load_workbook(tmp_path / "isolado.xlsx")
+    assert reloaded["grande"]["B2"].value == 2
+    assert list(reloaded["pequena"].tables) == ["Table1"]
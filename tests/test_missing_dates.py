@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from analysis.reporting.low_cost import build_low_cost_reputation_analysis
+from analysis.reporting.potential import build_potential_sku_analysis
+from analysis.reporting.product_focus import build_product_focus_analysis
+
+
+def test_dataset_keeps_sale_without_date(sales_dataset_missing_date):
+    missing = sales_dataset_missing_date["data"].isna()
+    assert missing.sum() == 1
+    assert sales_dataset_missing_date.loc[missing, "ano_mes"].isna().all()
+    assert sales_dataset_missing_date["ano_mes"].dtype == pd.Series([""]).astype(str).dtype
+
+
+@pytest.mark.parametrize("category", [None, "Casa"])
+def test_low_cost_report_ignores_missing_period(sales_dataset_missing_date, category):
+    result = build_low_cost_reputation_analysis(sales_dataset_missing_date.copy(), category, min_quantity=1)
+
+    assert "produtos_indicados" in result
+
+
+@pytest.mark.parametrize("category", [None, "Casa"])
+def test_potential_report_ignores_missing_period(sales_dataset_missing_date, category):
+    result = build_potential_sku_analysis(sales_dataset_missing_date.copy(), category, rank_size=5)
+
+    assert not result["potenciais"].empty
+    assert result["skus_potenciais_mensal"]["periodo"].notna().all()
+
+
+def test_product_focus_report_ignores_missing_period(sales_dataset_missing_date):
+    result = build_product_focus_analysis(sales_dataset_missing_date.copy(), "Casa")
+
+    assert result["analise_mensal"]["periodo"].notna().all()
@@ -0,0 +1,21 @@
+import pytest
+
+from analysis.reporting.potential import build_potential_sku_analysis
+
+
+@pytest.mark.parametrize("category", [None, "Casa", "Moda"])
+def test_potential_report_runs_per_category(sales_dataset, category):
+    result = build_potential_sku_analysis(sales_dataset.copy(), category, rank_size=5)
+
+    potenciais = result["potenciais"]
+    assert not potenciais.empty
+    if category:
+        assert set(potenciais["categoria"]) == {category}
+
+
+def test_potential_report_without_valid_recent_periods_is_empty(sales_dataset):
+    result = build_potential_sku_analysis(sales_dataset.copy(), "Casa", recent_periods=["1999-01"])
+
+    assert set(result) == {"potenciais", "skus_potenciais_mensal"}
+    assert result["potenciais"].empty
+    assert result["skus_potenciais_mensal"].empty